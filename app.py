@@ -1,13 +1,25 @@
-from flask import Flask, render_template, redirect, url_for, flash, request
+from flask import Flask, render_template, redirect, url_for, flash, request, make_response
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from config import Config
 from database import db
-from models import User, Document, Entity
-from datetime import datetime
+from models import User, Document, Entity, Job, DocumentInsight, DocumentChunk, CorpusState
+from datetime import datetime, timedelta
 import nlp_engine
-import pickle
+from embedding_codec import encode_embedding
 import os
+import hashlib
+import threading
 from search_engine import SearchEngine
+from search_service import SearchServiceError
+from jobs import JobQueue
+from insights import get_document_insight
+from search_filters import SearchFilters, SOURCES
+from query_cache import RankedResultCache, normalize_query
+import graph_store
+import related_papers
+import topics
+from dedup import title_hash, find_duplicate
+from pdf_pipeline import load_chunk_index
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -26,28 +38,155 @@ with app.app_context():
 login = LoginManager(app)
 login.login_view = 'login'
 
+job_queue = JobQueue(app, max_workers=app.config['JOB_WORKERS'])
+result_cache = RankedResultCache(ttl=app.config['SEARCH_RESULT_TTL'])
+
 # Global singleton
 _search_engine_instance = None
+_search_engine_lock = threading.Lock() # Background jobs may race requests to initialise it
 
 def get_search_engine():
     global _search_engine_instance
-    if _search_engine_instance is None:
-        try:
-            print("Initializing Search Engine (Lazy Load)...")
-            from search_engine import SearchEngine
-            engine = SearchEngine()
-            # Create app context to access DB
-            with app.app_context():
-                docs = Document.query.all()
-                if docs:
-                    engine.rebuild_index(docs)
-            _search_engine_instance = engine
-            print("Search Engine Ready.")
-        except Exception as e:
-            print(f"Failed to initialize search engine: {e}")
-            _search_engine_instance = None
+    if _search_engine_instance is not None:
+        return _search_engine_instance
+    with _search_engine_lock:
+        if _search_engine_instance is None:
+            _init_search_engine()
     return _search_engine_instance
 
+def _init_search_engine():
+    global _search_engine_instance
+    if app.config['SEARCH_SERVICE_URL']:
+        # The model and index live in search_service.py; this worker only holds a client
+        from search_service import SearchClient
+        _search_engine_instance = SearchClient(app.config['SEARCH_SERVICE_URL'])
+        print(f"Using search service at {app.config['SEARCH_SERVICE_URL']}.")
+        return
+    try:
+        print("Initializing Search Engine (Lazy Load)...")
+        from search_engine import SearchEngine
+        from query_cache import QueryEmbeddingCache, SharedQueryStore
+        from lexical_index import LexicalIndex
+        shared_store = None
+        if app.config['QUERY_CACHE_SHARED']:
+            # Quantised backends produce slightly different vectors, so each backend gets its own entries
+            namespace = f"{app.config['SEARCH_MODEL_NAME']}:{app.config['ENCODER_BACKEND']}"
+            shared_store = SharedQueryStore(os.path.join(instance_path, 'query_cache.db'), namespace=namespace)
+        engine = SearchEngine(
+            model_name=app.config['SEARCH_MODEL_NAME'],
+            index_type=app.config['SEARCH_INDEX_TYPE'],
+            nlist=app.config['SEARCH_NLIST'],
+            pq_m=app.config['SEARCH_PQ_M'],
+            nprobe=app.config['SEARCH_NPROBE'],
+            hnsw_m=app.config['SEARCH_HNSW_M'],
+            ef_search=app.config['SEARCH_EF_SEARCH'],
+            embedding_dtype=app.config['EMBEDDING_DTYPE'],
+            query_cache=QueryEmbeddingCache(app.config['QUERY_CACHE_SIZE'], shared_store),
+            lexical_index=LexicalIndex(app.config['LEXICAL_INDEX_PATH']),
+            rrf_k=app.config['SEARCH_RRF_K'],
+            min_similarity=app.config['SEARCH_MIN_SIMILARITY'],
+            encode_batch_size=app.config['ENCODE_BATCH_SIZE'],
+            encode_max_wait_ms=app.config['ENCODE_MAX_WAIT_MS'] if app.config['ENCODE_MAX_WAIT_MS'] >= 0 else None,
+            encoder_backend=app.config['ENCODER_BACKEND'],
+            model_dir=app.config['ENCODER_MODEL_DIR']
+        )
+        # Create app context to access DB
+        with app.app_context():
+            load_search_index(engine)
+            load_lexical_index(engine.lexical)
+        _search_engine_instance = engine
+        print("Search Engine Ready.")
+    except Exception as e:
+        print(f"Failed to initialize search engine: {e}")
+        _search_engine_instance = None
+
+def load_search_index(engine):
+    """
+    Restores the engine and its passage index from the on-disk snapshot and
+    replays only the papers and PDF chunks added since it was written. Falls
+    back to a full rebuild when the snapshot is missing, papers have been
+    deleted since (SQLite may hand a deleted paper's id to a new one, so ids
+    alone can't tell) or the corpus has outgrown the index it was trained as.
+    """
+    snapshot_path = app.config['SEARCH_SNAPSHOT_PATH']
+    doc_count, max_doc_id = db.session.query(db.func.count(Document.id), db.func.max(Document.id)).one()
+    max_doc_id = max_doc_id or 0
+    max_chunk_id = db.session.query(db.func.max(DocumentChunk.id)).scalar() or 0
+    version = corpus_version()
+    
+    snapshot = engine.load_snapshot(snapshot_path)
+    if snapshot:
+        covered = Document.query.filter(Document.id <= snapshot['max_doc_id']).count()
+        if snapshot.get('corpus_version') != version or covered != snapshot['doc_count']:
+            print("Search index snapshot is stale, rebuilding.")
+            engine.chunks.clear()
+            snapshot = None
+        elif engine.outgrown(doc_count):
+            print(f"Search index snapshot was trained for far fewer than {doc_count} papers, rebuilding.")
+            engine.chunks.clear()
+            snapshot = None
+            
+    if snapshot:
+        if max_doc_id <= snapshot['max_doc_id'] and max_chunk_id <= snapshot['max_chunk_id']:
+            return
+        if max_doc_id > snapshot['max_doc_id']:
+            new_docs = Document.query.filter(Document.id > snapshot['max_doc_id']).order_by(Document.id).all()
+            print(f"Replaying {len(new_docs)} documents added since the snapshot...")
+            engine.extend_index(new_docs)
+        load_chunk_index(engine, after_id=snapshot['max_chunk_id'])
+    else:
+        docs = Document.query.all()
+        if not docs:
+            return
+        engine.rebuild_index(docs)
+        load_chunk_index(engine)
+        
+    # Persist any embeddings generated during indexing so they are not recomputed
+    db.session.commit()
+    try:
+        # Watermark from what was loaded, in case chunks were stored while loading
+        engine.save_snapshot(snapshot_path, doc_count, max_doc_id, version, max(engine.chunks.doc_of, default=0))
+    except Exception as e:
+        print(f"Failed to save search index snapshot: {e}")
+
+def corpus_version():
+    state = db.session.get(CorpusState, 1)
+    return state.version if state else 0
+
+def _bump_corpus_version():
+    """Marks every index snapshot stale. Runs in the caller's transaction."""
+    if db.session.get(CorpusState, 1) is None:
+        db.session.add(CorpusState(id=1, version=0))
+        db.session.flush()
+    db.session.execute(db.update(CorpusState).where(CorpusState.id == 1).values(version=CorpusState.version + 1))
+
+def load_lexical_index(lexical, batch_size=1000):
+    """
+    Brings the shared BM25 index in line with the Document table: indexes rows
+    added since it was last written, or rebuilds it if papers were deleted
+    since (a reused id would keep the deleted paper's text) or rows it held are gone.
+    """
+    version = corpus_version()
+    count, max_id = lexical.stats()
+    covered = Document.query.filter(Document.id <= max_id).count()
+    if lexical.corpus_version() != version or covered != count:
+        print("Lexical index is stale, rebuilding.")
+        lexical.clear()
+        max_id = 0
+        
+    indexed = 0
+    while True:
+        rows = db.session.query(Document.id, Document.title, Document.abstract) \
+            .filter(Document.id > max_id).order_by(Document.id).limit(batch_size).all()
+        if not rows:
+            break
+        lexical.add(rows)
+        max_id = rows[-1][0]
+        indexed += len(rows)
+    lexical.set_corpus_version(version)
+    if indexed:
+        print(f"Added {indexed} documents to the lexical index.")
+
 @login.user_loader
 def load_user(id):
     return db.session.get(User, int(id))
@@ -103,23 +242,79 @@ def register():
 @login_required
 def dashboard():
     query = request.args.get('q')
+    mode = request.args.get('mode') or app.config['SEARCH_MODE']
+    filters = SearchFilters.from_args(request.args)
+    per_page = app.config['SEARCH_PAGE_SIZE']
     engine = get_search_engine()
+    pagination = {}
+    similarities = {}
+    results = None
     
     if query and engine:
-        results = engine.search(query) # List of (id, score)
+        try:
+            results = ranked_results(engine, query, mode, filters)
+        except SearchServiceError as e:
+            print(f"Search failed: {e}")
+            flash('Search is unavailable right now, showing the latest papers instead.')
+            
+    if results is not None:
+        page = max(request.args.get('page', 1, type=int), 1)
+        page_results = results[(page - 1) * per_page:page * per_page]
+        documents = Document.get_many([doc_id for doc_id, _ in page_results])
+        if mode == 'semantic':
+            similarities = dict(page_results) # Cosine similarities; fused ranks have no comparable score
         if not results:
-            documents = []
-            flash(f'No semantic matches found for "{query}".')
-        else:
-            doc_ids = [r[0] for r in results]
-            documents = []
-            for doc_id in doc_ids:
-                d = db.session.get(Document, doc_id)
-                if d: documents.append(d)
+            flash(f'No matches found for "{query}".')
+        pagination = {
+            "prev_page": page - 1 if page > 1 else None,
+            "next_page": page + 1 if page * per_page < len(results) else None
+        }
     else:
-        documents = Document.query.order_by(Document.ingestion_date.desc()).limit(20).all()
+        # Keyset pagination: the cursor is the (ingestion_date, id) of the last paper shown
+        recent = filters.apply(Document.query.options(db.defer(Document.embedding)))
+        cursor = parse_cursor(request.args.get('cursor'))
+        if cursor:
+            recent = recent.filter(db.tuple_(Document.ingestion_date, Document.id) < cursor)
+        documents = recent.order_by(Document.ingestion_date.desc(), Document.id.desc()).limit(per_page + 1).all()
+        has_more = len(documents) > per_page
+        documents = documents[:per_page]
+        pagination = {
+            "first_page": bool(cursor),
+            "next_cursor": make_cursor(documents[-1]) if has_more else None
+        }
         
-    return render_template('dashboard.html', documents=documents)
+    return render_template('dashboard.html', documents=documents, sources=SOURCES, pagination=pagination,
+                           similarities=similarities)
+
+def ranked_results(engine, query, mode, filters):
+    """
+    The full ranked [(doc_id, score)] list for a search, up to SEARCH_DEEP_K.
+    Computed once per query, mode and filters, then served from result_cache
+    while the user pages through it.
+    """
+    key = (normalize_query(query), mode, filters.key())
+    
+    def compute():
+        # Filters are applied inside the index searches, not to the top-k afterwards
+        allowed_ids = filters.doc_ids() if filters else None
+        k = app.config['SEARCH_DEEP_K']
+        if mode == 'semantic':
+            return engine.search(query, k, allowed_ids=allowed_ids)
+        if mode == 'lexical':
+            return engine.lexical_search(query, k, allowed_ids=allowed_ids)
+        return engine.hybrid_search(query, k, candidates=k, allowed_ids=allowed_ids)
+    
+    return result_cache.get_or_compute(key, compute)
+
+def make_cursor(doc):
+    return f"{doc.ingestion_date.isoformat()}_{doc.id}"
+
+def parse_cursor(cursor):
+    try:
+        timestamp, doc_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(doc_id)
+    except (AttributeError, ValueError):
+        return None
 
 @app.route('/document/<int:id>')
 @login_required
@@ -128,35 +323,24 @@ def document_detail(id):
     if not doc:
         return redirect(url_for('dashboard'))
         
-    related_docs = []
-    engine = get_search_engine()
-    if engine:
-        similar = engine.find_similar(id, k=5)
-        for sim_id, score in similar:
-            d = db.session.get(Document, sim_id)
-            if d:
-                related_docs.append(d)
+    related_docs = related_papers.related_documents(id)
+    if not related_docs and not related_papers.is_materialised():
+        # Neighbours haven't been materialised yet (python related_papers.py); search live
+        engine = get_search_engine()
+        if engine:
+            try:
+                similar = engine.find_similar(id, k=5)
+                related_docs = Document.get_many([sim_id for sim_id, score in similar])
+            except SearchServiceError as e:
+                print(f"Similar papers lookup failed: {e}")
                 
-    # Calculate Word Frequency
-    from collections import Counter
-    import re
-    words = re.findall(r'\w+', doc.abstract.lower())
-    stopwords = set(['the', 'and', 'of', 'to', 'in', 'a', 'is', 'for', 'that', 'on', 'with', 'as', 'are', 'by', 'it', 'an', 'be', 'this', 'from', 'at', 'which', 'or', 'not', 'but', 'can', 'has', 'have', 'we', 'our', 'their', 'all', 'more', 'one', 'new', 'used', 'using', 'also', 'paper', 'results', 'data', 'model', 'based', 'such', 'these'])
-    filtered_words = [w for w in words if w not in stopwords and len(w) > 2 and not w.isdigit()]
-    word_counts = Counter(filtered_words).most_common(10) # List of (word, count)
+    # Summary and word frequencies are computed once and stored
+    insight = get_document_insight(doc)
     
     # Prepare data for Chart.js
-    chart_labels = [w[0] for w in word_counts]
-    chart_data = [w[1] for w in word_counts]
-    
-    # Generate Summary
-    try:
-        summary = nlp_engine.generate_summary(doc.abstract)
-    except Exception as e:
-        print(f"ERROR summarizing {doc.title}: {e}")
-        import traceback
-        traceback.print_exc()
-        summary = "Summary generation unavailable."
+    chart_labels = [w[0] for w in insight.top_terms]
+    chart_data = [w[1] for w in insight.top_terms]
+    summary = insight.summary
 
     return render_template('document_detail.html', doc=doc, related_docs=related_docs, chart_labels=chart_labels, chart_data=chart_data, summary=summary)
 
@@ -168,7 +352,160 @@ def admin_dashboard():
     total_users = User.query.count()
     total_entities = Entity.query.count()
     
-    return render_template('admin_dashboard.html', total_papers=total_papers, total_users=total_users, total_entities=total_entities)
+    # Only report cache stats if this worker has already loaded the engine
+    try:
+        query_cache_stats = _search_engine_instance.cache_stats() if _search_engine_instance else None
+    except SearchServiceError as e:
+        print(f"Could not fetch cache stats: {e}")
+        query_cache_stats = None
+    
+    return render_template('admin_dashboard.html', total_papers=total_papers, total_users=total_users, total_entities=total_entities,
+                           query_cache_stats=query_cache_stats)
+
+def ingest_arxiv_job(progress, query, max_results):
+    """Background job: fetch and index ArXiv papers for a query."""
+    from ingestion.arxiv_fetcher import fetch_arxiv_papers
+    progress(0, message=f'Fetching papers for "{query}"')
+    count = fetch_arxiv_papers(query=query, max_results=max_results,
+                               on_batch=lambda done: progress(done, message=f"Ingested {done} new papers"))
+    progress(count, message=f'Fetched {count} new papers for "{query}"')
+    schedule_topic_clustering()
+    return {"count": count}
+
+def process_pdf_job(progress, file_path, filename, source_url):
+    """
+    Background job: streams the PDF's pages from a process pool, creates the
+    paper from its opening pages, then embeds the full text in chunks.
+    """
+    from itertools import chain
+    from pdf_pipeline import page_count, stream_pages, chunk_pages, index_chunks
+    total_pages = page_count(file_path)
+    progress(0, total=total_pages, message=f'Extracting text from "{filename}"')
+    pages = stream_pages(file_path, processes=app.config['PDF_PROCESSES'], total=total_pages)
+    
+    # Title and abstract come from the opening pages; the rest stays in the stream
+    head = []
+    for page in pages:
+        head.append(page)
+        if len(head) == 5 or sum(len(text) for _, text in head) >= 5000:
+            break
+    text = "".join(page_text + "\n" for _, page_text in head)
+    
+    lines = [l for l in text.split('\n') if l.strip()]
+    raw_title = lines[0].strip() if lines else "Uploaded PDF"
+    title = raw_title[:295] + "..." if len(raw_title) > 300 else raw_title
+    
+    abstract = text[:5000] # Increased limit but still safe
+    
+    engine = get_search_engine()
+    try:
+        embedding = engine.encode(abstract) if engine else None
+    except SearchServiceError as e:
+        # Store the paper anyway; the service indexes it from the table when it starts again.
+        # Its passages need embeddings, so they are skipped.
+        print(f"Search service unavailable, adding the PDF unindexed: {e}")
+        engine = embedding = None
+    # A PDF without extractable text has nothing to compare. The first line is often a venue
+    # header rather than the title, so only the embedding can identify a duplicate
+    duplicate_of = find_duplicate(engine, title, embedding, app.config['DEDUP_SIMILARITY'],
+                                  trust_title=False) if lines else None
+    if duplicate_of is not None:
+        pages.close() # Stops the extraction pool
+        progress(total_pages, message=f'"{filename}" is already in the library as paper #{duplicate_of}')
+        return {"doc_id": duplicate_of, "duplicate": True}
+    
+    doc = Document(
+        title=title,
+        title_hash=title_hash(title),
+        abstract=abstract,
+        source_url=source_url,
+        published_date=datetime.utcnow()
+    )
+    db.session.add(doc)
+    db.session.commit()
+    
+    progress(len(head), message="Indexing and extracting entities")
+    if engine:
+        try:
+            embedding = engine.add_document(doc.id, abstract, embedding=embedding, title=title)
+            doc.embedding = encode_embedding(embedding, app.config['EMBEDDING_DTYPE'])
+            related_papers.add_documents(engine, [doc.id])
+            topics.assign_documents(engine, [doc.id])
+        except Exception as e:
+            print(f"Indexing error: {e}")
+    
+    try:
+        extracted = nlp_engine.extract_entities(abstract)
+        for text_ent, label in extracted:
+            safe_text = text_ent[:95] + "..." if len(text_ent) > 100 else text_ent
+            entity = Entity(text=safe_text, label=label, document=doc)
+            db.session.add(entity)
+        graph_store.add_document_concepts({doc.id: extracted})
+    except Exception as e:
+        print(f"NER error: {e}")
+        
+    db.session.commit()
+    
+    chunks = 0
+    if engine:
+        chunks = index_chunks(engine, doc.id,
+                              chunk_pages(chain(head, pages), app.config['PDF_CHUNK_CHARS'],
+                                          app.config['PDF_CHUNK_OVERLAP']),
+                              embedding_dtype=app.config['EMBEDDING_DTYPE'],
+                              on_batch=lambda done, page: progress(page, message=f"Indexed {done} passages"))
+        result_cache.clear()
+    else:
+        pages.close()
+    schedule_topic_clustering()
+    if not engine:
+        progress(total_pages, message=f'Stored "{filename}" without indexing: search is unavailable')
+        return {"doc_id": doc.id, "chunks": 0, "indexed": False}
+    progress(total_pages, message=f'Processed "{filename}" ({chunks} passages)')
+    return {"doc_id": doc.id, "chunks": chunks, "indexed": True}
+
+def materialise_related_job(progress):
+    engine = get_search_engine()
+    if not engine:
+        raise RuntimeError("Search engine unavailable")
+    return {"documents": related_papers.materialise(engine, progress=progress)}
+
+@app.route('/admin/related-papers', methods=['POST'])
+@login_required
+def rebuild_related_papers():
+    job_id = job_queue.enqueue('related_papers', materialise_related_job, user_id=current_user.id)
+    flash(f'Recomputing related papers in the background (job #{job_id}).')
+    return redirect(url_for('admin_dashboard'))
+
+def cluster_topics_job(progress):
+    engine = get_search_engine()
+    if not engine:
+        raise RuntimeError("Search engine unavailable")
+    return {"topics": topics.cluster(engine, k=app.config['TOPIC_COUNT'])}
+
+def schedule_topic_clustering(user_id=None, force=False):
+    """
+    Queues a full re-cluster once enough papers were assigned incrementally
+    (or when forced), unless one is already queued or running. Jobs that
+    have sat in either state past TOPIC_JOB_TIMEOUT_MINUTES were orphaned by
+    a worker that died, and are ignored.
+    """
+    if not force and not topics.needs_recluster(app.config['TOPIC_RECLUSTER_FRACTION']):
+        return None
+    cutoff = datetime.utcnow() - timedelta(minutes=app.config['TOPIC_JOB_TIMEOUT_MINUTES'])
+    if Job.query.filter(Job.kind == 'topics', Job.status.in_(('queued', 'running')),
+                        db.func.coalesce(Job.started_at, Job.created_at) > cutoff).first():
+        return None
+    return job_queue.enqueue('topics', cluster_topics_job, user_id=user_id)
+
+@app.route('/admin/topics', methods=['POST'])
+@login_required
+def recluster_topics():
+    job_id = schedule_topic_clustering(user_id=current_user.id, force=True)
+    if job_id:
+        flash(f'Clustering topics in the background (job #{job_id}).')
+    else:
+        flash('Topic clustering is already running.')
+    return redirect(url_for('admin_dashboard'))
 
 @app.route('/add-paper', methods=['GET', 'POST'])
 @login_required
@@ -193,8 +530,21 @@ def add_paper():
                 except ValueError:
                     pass
             
+            engine = get_search_engine()
+            try:
+                embedding = engine.encode(abstract) if engine else None
+            except SearchServiceError as e:
+                # Store the paper anyway; the service indexes it from the table when it starts again
+                print(f"Search service unavailable, adding the paper unindexed: {e}")
+                engine = embedding = None
+            duplicate_of = find_duplicate(engine, title, embedding, app.config['DEDUP_SIMILARITY'])
+            if duplicate_of is not None:
+                flash('This paper is already in the library.')
+                return redirect(url_for('document_detail', id=duplicate_of))
+            
             doc = Document(
                 title=title,
+                title_hash=title_hash(title),
                 abstract=abstract,
                 source_url=source_url,
                 published_date=published_date
@@ -203,11 +553,12 @@ def add_paper():
             db.session.commit() # Commit first to get ID
             
             # Indexing
-            engine = get_search_engine()
             if engine:
                 try:
-                    embedding = engine.add_document(doc.id, abstract)
-                    doc.embedding = pickle.dumps(embedding)
+                    embedding = engine.add_document(doc.id, abstract, embedding=embedding, title=title)
+                    doc.embedding = encode_embedding(embedding, app.config['EMBEDDING_DTYPE'])
+                    related_papers.add_documents(engine, [doc.id])
+                    topics.assign_documents(engine, [doc.id])
                 except Exception as e:
                     print(f"Indexing error: {e}")
             
@@ -218,10 +569,13 @@ def add_paper():
                     safe_text = text[:95] + "..." if len(text) > 100 else text
                     entity = Entity(text=safe_text, label=label, document=doc)
                     db.session.add(entity)
+                graph_store.add_document_concepts({doc.id: extracted})
             except Exception as e:
                 print(f"NER error: {e}")
                 
             db.session.commit()
+            result_cache.clear() # Let searches pick up the new paper straight away
+            schedule_topic_clustering()
             flash('Paper added successfully! Entities extracted.')
             return redirect(url_for('document_detail', id=doc.id))
             
@@ -229,14 +583,10 @@ def add_paper():
             query = request.form['query']
             max_results = int(request.form['max_results'])
             
-            from ingestion.arxiv_fetcher import fetch_arxiv_papers
-            try:
-                fetch_arxiv_papers(query=query, max_results=max_results)
-                flash(f'Successfully fetched papers for "{query}". Embeddings will be generated on next restart or search.')
-            except Exception as e:
-                flash(f"Error fetching papers: {e}")
-            
-            return redirect(url_for('dashboard'))
+            job_id = job_queue.enqueue('arxiv_ingest', ingest_arxiv_job, query, max_results,
+                                       user_id=current_user.id, total=max_results)
+            flash(f'Fetching papers for "{query}" in the background (job #{job_id}).')
+            return redirect(url_for('add_paper'))
 
         elif action == 'upload':
             file = request.files['file']
@@ -247,57 +597,41 @@ def add_paper():
                 file_path = os.path.join(upload_folder, filename)
                 file.save(file_path)
                 
-                try:
-                    import pypdf
-                    reader = pypdf.PdfReader(file_path)
-                    text = ""
-                    for page in reader.pages[:5]:
-                        text += (page.extract_text() or "") + "\n"
-                    
-                    lines = [l for l in text.split('\n') if l.strip()]
-                    raw_title = lines[0].strip() if lines else "Uploaded PDF"
-                    title = raw_title[:295] + "..." if len(raw_title) > 300 else raw_title
-                    
-                    abstract = text[:5000] # Increased limit but still safe
-                    
-                    doc = Document(
-                        title=title,
-                        abstract=abstract,
-                        
-                        source_url=url_for('static', filename=f'uploads/{filename}'),
-                        published_date=datetime.utcnow()
-                    )
-                    db.session.add(doc)
-                    db.session.commit()
-                    
-                    engine = get_search_engine()
-                    if engine:
-                        try:
-                            embedding = engine.add_document(doc.id, abstract)
-                            doc.embedding = pickle.dumps(embedding)
-                        except Exception as e:
-                            print(f"Indexing error: {e}")
-                    
-                    try:
-                        extracted = nlp_engine.extract_entities(abstract)
-                        for text_ent, label in extracted:
-                            safe_text = text_ent[:95] + "..." if len(text_ent) > 100 else text_ent
-                            entity = Entity(text=safe_text, label=label, document=doc)
-                            db.session.add(entity)
-                    except Exception as e:
-                        print(f"NER error: {e}")
-                        
-                    db.session.commit()
-                    flash(f'PDF "{filename}" uploaded and processed successfully!')
-                    return redirect(url_for('document_detail', id=doc.id))
-                    
-                except Exception as e:
-                    import traceback
-                    traceback.print_exc()
-                    flash(f'Error processing PDF: {str(e)}')
-                    return redirect(url_for('add_paper'))
+                source_url = url_for('static', filename=f'uploads/{filename}')
+                job_id = job_queue.enqueue('pdf_upload', process_pdf_job, file_path, filename, source_url,
+                                           user_id=current_user.id)
+                flash(f'PDF "{filename}" uploaded. Processing in the background (job #{job_id}).')
+                return redirect(url_for('add_paper'))
             
-    return render_template('add_paper.html')
+    recent_jobs = Job.query.filter_by(user_id=current_user.id).order_by(Job.created_at.desc()).limit(5).all()
+    return render_template('add_paper.html', recent_jobs=recent_jobs)
+
+def delete_documents(doc_ids):
+    """Deletes papers with their entities, concepts, insights, passages and related lists, then unindexes them."""
+    affected = set()
+    for doc_id in doc_ids:
+        graph_store.remove_document_concepts(doc_id)
+        Entity.query.filter_by(doc_id=doc_id).delete()
+        DocumentInsight.query.filter_by(doc_id=doc_id).delete()
+        DocumentChunk.query.filter_by(doc_id=doc_id).delete()
+        affected.update(related_papers.remove_document(doc_id))
+        topics.remove_document(doc_id)
+        Document.query.filter_by(id=doc_id).delete()
+    _bump_corpus_version()
+    db.session.commit()
+    
+    engine = get_search_engine()
+    if engine:
+        try:
+            for doc_id in doc_ids:
+                engine.remove_document(doc_id)
+            # Papers that listed a deleted one get a fresh neighbour list
+            related_papers.refresh(engine, list(affected.difference(doc_ids)))
+            db.session.commit()
+        except SearchServiceError as e:
+            # The bumped corpus version makes the service rebuild its index when it starts again
+            print(f"Could not unindex deleted papers: {e}")
+        result_cache.clear()
 
 @app.route('/delete-paper/<int:id>', methods=['POST'])
 @login_required
@@ -307,11 +641,7 @@ def delete_paper(id):
         flash('Document not found.')
         return redirect(url_for('dashboard'))
     
-    from models import Entity
-    Entity.query.filter_by(doc_id=id).delete()
-    
-    db.session.delete(doc)
-    db.session.commit()
+    delete_documents([id])
     flash('Paper deleted successfully.')
     return redirect(url_for('dashboard'))
 
@@ -357,59 +687,149 @@ def logout():
 @app.route('/graph')
 @login_required
 def graph():
-    return render_template('graph.html')
+    # Forward ?doc=, ?concept=, ?label=, ?min_degree= so the page can show filtered or ego graphs;
+    # "load more" adds its own page number
+    args = {key: value for key, value in request.args.items() if key != 'page'}
+    return render_template('graph.html', data_url=url_for('graph_data', **args))
 
 @app.route('/graph-data')
 @login_required
 def graph_data():
-    documents = Document.query.all()
-    
-    nodes = []
-    edges = []
-    
-    # Track added concepts to merge them (Concept Text -> Node ID)
-    concept_map = {} 
-    concept_counter = 0
-    
-    for doc in documents:
-        # Add Paper Node
-        doc_node_id = f"doc_{doc.id}"
-        # Truncate title for label
-        label = doc.title[:30] + "..." if len(doc.title) > 30 else doc.title
-        nodes.append({
-            "id": doc_node_id,
-            "label": label,
-            "group": "paper",
-            "title": doc.title  # Tooltip
-        })
+    """
+    Serves the materialised knowledge graph. Query parameters:
+    page/per_page (concepts by degree), papers (per concept), label,
+    min_degree, or doc/concept for an ego graph around one paper or concept.
+    Responses carry an ETag derived from the graph version, so unchanged
+    graphs come back as 304.
+    """
+    graph_store.ensure_graph()
+    etag = f"{graph_store.graph_version()}-{hashlib.sha1(request.query_string).hexdigest()[:12]}"
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
         
-        # Add Entities
-        for entity in doc.entities:
-            # key = (entity.text.lower(), entity.label)
-            # Use raw text for display but lower for merging
-            key = entity.text.lower()
-            
-            if key not in concept_map:
-                concept_id = f"conc_{concept_counter}"
-                concept_counter += 1
-                concept_map[key] = concept_id
-                
-                nodes.append({
-                    "id": concept_id,
-                    "label": entity.text,
-                    "group": "entity", # We could use entity.label for color groups later
-                    "color": "#e0e7ff" # Light indigo default
-                })
-            else:
-                concept_id = concept_map[key]
-                
-            # Add Edge
-            edges.append({
-                "from": doc_node_id,
-                "to": concept_id
-            })
-            
-    return {"nodes": nodes, "edges": edges}
+    doc_id = request.args.get('doc', type=int)
+    concept_id = request.args.get('concept', type=int)
+    if doc_id is not None or concept_id is not None:
+        data = graph_store.ego_graph(doc_id=doc_id, concept_id=concept_id,
+                                     limit=min(request.args.get('limit', 100, type=int), 1000))
+    else:
+        data = graph_store.graph_page(
+            page=max(request.args.get('page', 1, type=int), 1),
+            per_page=min(max(request.args.get('per_page', 200, type=int), 1), 1000),
+            label=request.args.get('label') or None,
+            min_degree=request.args.get('min_degree', 1, type=int),
+            papers_per_concept=min(max(request.args.get('papers', 20, type=int), 1), 100)
+        )
+        
+    response = make_response(data)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache' # Always revalidate, but reuse on 304
+    return response
+
+@app.route('/api/search')
+@login_required
+def search_api():
+    """Offset-paged search: ?q=&mode=&offset=&limit= plus the dashboard filters."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return {"error": "Missing query"}, 400
+    engine = get_search_engine()
+    if not engine:
+        return {"error": "Search engine unavailable"}, 503
+    mode = request.args.get('mode') or app.config['SEARCH_MODE']
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', app.config['SEARCH_PAGE_SIZE'], type=int), 1), 100)
+    
+    try:
+        results = ranked_results(engine, query, mode, SearchFilters.from_args(request.args))
+    except SearchServiceError as e:
+        print(f"Search failed: {e}")
+        return {"error": "Search engine unavailable"}, 503
+    page_results = results[offset:offset + limit]
+    docs = {doc.id: doc for doc in Document.get_many([doc_id for doc_id, _ in page_results], titles_only=True)}
+    return {
+        "results": [
+            {"id": doc_id, "title": docs[doc_id].title, "score": score, "url": url_for('document_detail', id=doc_id)}
+            for doc_id, score in page_results if doc_id in docs
+        ],
+        "offset": offset,
+        "total": len(results),
+        "next_offset": offset + limit if offset + limit < len(results) else None
+    }
+
+@app.route('/api/concepts')
+@login_required
+def list_concepts():
+    limit = min(request.args.get('limit', 20, type=int), 200)
+    label = request.args.get('label')
+    graph_store.ensure_graph()
+    return {"concepts": [graph_store.concept_dict(c) for c in graph_store.top_concepts(limit, label)]}
+
+@app.route('/api/concepts/papers')
+@login_required
+def concept_papers():
+    text = request.args.get('q', '').strip()
+    if not text:
+        return {"error": "Missing concept text"}, 400
+    label = request.args.get('label')
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    graph_store.ensure_graph()
+    docs = graph_store.papers_mentioning(text, label, limit)
+    return {
+        "concepts": [graph_store.concept_dict(c) for c in graph_store.find_concept(text, label)],
+        "papers": [{"id": doc.id, "title": doc.title, "url": url_for('document_detail', id=doc.id)} for doc in docs]
+    }
+
+@app.route('/topics')
+@login_required
+def topic_map():
+    overview = topics.topic_overview()
+    samples = {topic["id"]: topics.topic_papers(topic["id"], limit=5) for topic in overview}
+    return render_template('topics.html', topics=overview, samples=samples, state=topics.topic_state())
+
+@app.route('/api/topics')
+@login_required
+def list_topics():
+    """Topic labels and sizes from the last clustering run; ETag follows the topic version."""
+    etag = f"topics-{topics.topic_version()}"
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    response = make_response({"topics": topics.topic_overview()})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/api/topics/<int:id>/papers')
+@login_required
+def topic_papers(id):
+    limit = min(request.args.get('limit', 20, type=int), 200)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    docs = topics.topic_papers(id, limit, offset)
+    return {"papers": [{"id": doc.id, "title": doc.title, "url": url_for('document_detail', id=doc.id)} for doc in docs]}
+
+@app.route('/api/jobs')
+@login_required
+def list_jobs():
+    jobs = Job.query.filter_by(user_id=current_user.id).order_by(Job.created_at.desc()).limit(20).all()
+    return {"jobs": [job_status(job) for job in jobs]}
+
+@app.route('/api/jobs/<int:id>')
+@login_required
+def job_detail(id):
+    job = db.session.get(Job, id)
+    if not job or job.user_id != current_user.id:
+        return {"error": "Job not found"}, 404
+    return job_status(job)
+
+def job_status(job):
+    status = job.to_dict()
+    if job.result and job.result.get('doc_id'):
+        status['document_url'] = url_for('document_detail', id=job.result['doc_id'])
+    return status
 
 @app.route('/api/chat', methods=['POST'])
 @login_required
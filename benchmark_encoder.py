@@ -0,0 +1,86 @@
+"""
+Encoder benchmarks:
+
+1. Per-backend single-query latency and bulk (ingestion) throughput, e.g.
+   torch vs torch_int8 vs ONNX Runtime (see encoders.py).
+2. Query encoding under concurrent load: every request calling
+   model.encode() on its own versus the MicroBatcher front end that
+   coalesces concurrent calls into one batch (uses the first backend).
+
+Usage:
+    python benchmark_encoder.py                       # torch, 16 client threads, 512 queries
+    python benchmark_encoder.py --backends torch torch_int8 onnx onnx_int8 --model-dir models/minilm-onnx
+    python benchmark_encoder.py --threads 1 8 32 --batch-sizes 8 32 --waits 1 2 5
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from encoders import create_encoder
+from micro_batcher import MicroBatcher
+
+TOPICS = ["graph neural networks", "protein folding", "diffusion models", "reinforcement learning",
+          "speech recognition", "federated learning", "object detection", "machine translation"]
+
+def make_queries(n):
+    # Distinct strings, so nothing is served from a cache
+    return [f"{TOPICS[i % len(TOPICS)]} {i}" for i in range(n)]
+
+def backend_report(name, model, queries, bulk_batch_size=64):
+    latencies = []
+    for query in queries[:200]:
+        start = time.perf_counter()
+        model.encode([query])
+        latencies.append((time.perf_counter() - start) * 1000)
+    start = time.perf_counter()
+    model.encode(queries, batch_size=bulk_batch_size)
+    throughput = len(queries) / (time.perf_counter() - start)
+    print(f"{name:<12} {np.median(latencies):>8.2f} {np.percentile(latencies, 95):>8.2f} {throughput:>12.1f}")
+
+def run_clients(encode, queries, threads):
+    """Fires the queries from `threads` client threads and returns queries per second."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(encode, queries))
+    return len(queries) / (time.perf_counter() - start)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='all-MiniLM-L6-v2')
+    parser.add_argument('--model-dir', help="Local model directory (required for the ONNX backends)")
+    parser.add_argument('--backends', nargs='+', default=['torch'])
+    parser.add_argument('--queries', type=int, default=512)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 16])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[32])
+    parser.add_argument('--waits', type=float, nargs='+', default=[2.0], help="Max wait in ms")
+    args = parser.parse_args()
+
+    queries = make_queries(args.queries)
+    models = {}
+    print(f"{'backend':<12} {'p50 ms':>8} {'p95 ms':>8} {'bulk texts/s':>12}")
+    for backend in args.backends:
+        # The ONNX files live in --model-dir; the torch backends load by name unless it's a SentenceTransformer dir
+        model_dir = args.model_dir if backend.startswith('onnx') else None
+        models[backend] = create_encoder(backend, args.model, model_dir)
+        models[backend].encode(queries[:8]) # Warm up
+        backend_report(backend, models[backend], queries)
+    print()
+    
+    model = models[args.backends[0]]
+
+    # Serial baseline: a lock mirrors one model shared by request threads
+    lock = threading.Lock()
+    def encode_one(text):
+        with lock:
+            return model.encode([text])[0]
+
+    print(f"{'mode':<28} {'threads':>7} {'queries/s':>10} {'mean batch':>11}")
+    for threads in args.threads:
+        print(f"{'per-request':<28} {threads:>7} {run_clients(encode_one, queries, threads):>10.1f} {1.0:>11.1f}")
+        for batch_size in args.batch_sizes:
+            for wait in args.waits:
+                batcher = MicroBatcher(model.encode, max_batch_size=batch_size, max_wait_ms=wait)
+                rate = run_clients(batcher, queries, threads)
+                label = f"batched (size {batch_size}, {wait:g} ms)"
+                print(f"{label:<28} {threads:>7} {rate:>10.1f} {batcher.stats()['mean_batch_size']:>11.1f}")
@@ -0,0 +1,100 @@
+"""
+Recall-vs-latency report for the SearchEngine index types.
+
+Every approximate index is compared against the exact flat (brute-force)
+baseline on held-out queries, so SEARCH_INDEX_TYPE / SEARCH_NPROBE /
+SEARCH_EF_SEARCH can be picked from measurements.
+
+Usage:
+    python benchmark_index.py                    # embeddings stored in the database
+    python benchmark_index.py --synthetic 50000  # random vectors, no database needed
+"""
+import argparse
+import time
+import numpy as np
+import faiss
+from search_engine import create_index, apply_search_params, normalize_rows
+from embedding_codec import load_matrix
+
+DIMENSION = 384
+
+def load_db_embeddings():
+    from app import app
+    from models import Document
+    with app.app_context():
+        rows = Document.query.filter(Document.embedding.isnot(None)).with_entities(Document.embedding).all()
+    return load_matrix([row[0] for row in rows], DIMENSION)
+
+def time_queries(index, queries, k):
+    """Runs queries one at a time (as the web app does) and returns (results, per-query latencies in ms)."""
+    latencies = []
+    results = np.empty((len(queries), k), dtype='int64')
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results[i] = ids[0]
+    return results, np.asarray(latencies)
+
+def recall_at_k(results, ground_truth):
+    hits = 0
+    for found, expected in zip(results, ground_truth):
+        hits += len(set(found[found != -1]) & set(expected))
+    return hits / ground_truth.size
+
+def run(vectors, n_queries, k, nlist, pq_m, hnsw_m):
+    rng = np.random.default_rng(42)
+    order = rng.permutation(len(vectors))
+    queries = vectors[order[:n_queries]]
+    corpus = vectors[order[n_queries:]]
+    print(f"Corpus: {len(corpus)} vectors, {len(queries)} held-out queries, k={k}\n")
+    
+    ids = np.arange(len(corpus), dtype='int64')
+    baseline = faiss.IndexFlatIP(DIMENSION)
+    baseline.add(corpus)
+    ground_truth, flat_latency = time_queries(baseline, queries, k)
+    
+    rows = [("flat", "-", 0.0, 1.0, flat_latency)]
+    configs = [
+        ("ivf_flat", "nprobe", [1, 4, 8, 16, 32]),
+        ("ivf_pq", "nprobe", [1, 4, 8, 16, 32]),
+        ("hnsw", "efSearch", [16, 32, 64, 128]),
+    ]
+    for index_type, knob, values in configs:
+        start = time.perf_counter()
+        index = create_index(index_type, DIMENSION, corpus, nlist=nlist, pq_m=pq_m, hnsw_m=hnsw_m)
+        index.add_with_ids(corpus, ids)
+        build_seconds = time.perf_counter() - start
+        if index_type != 'hnsw' and not isinstance(index, faiss.IndexIVF):
+            print(f"Skipping {index_type}: corpus too small to train it.")
+            continue
+        for value in values:
+            apply_search_params(index, nprobe=value, ef_search=value)
+            results, latency = time_queries(index, queries, k)
+            rows.append((index_type, f"{knob}={value}", build_seconds, recall_at_k(results, ground_truth), latency))
+            
+    print(f"{'index':<10} {'setting':<14} {'build s':>8} {f'recall@{k}':>10} {'mean ms':>9} {'p95 ms':>9} {'speedup':>8}")
+    flat_mean = flat_latency.mean()
+    for index_type, setting, build_seconds, recall, latency in rows:
+        print(f"{index_type:<10} {setting:<14} {build_seconds:>8.2f} {recall:>10.3f} "
+              f"{latency.mean():>9.3f} {np.percentile(latency, 95):>9.3f} {flat_mean / latency.mean():>7.1f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--synthetic', type=int, default=0, help="Benchmark N random vectors instead of the database")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--nlist', type=int, default=100)
+    parser.add_argument('--pq-m', type=int, default=48)
+    parser.add_argument('--hnsw-m', type=int, default=32)
+    args = parser.parse_args()
+    
+    if args.synthetic:
+        vectors = np.random.default_rng(0).standard_normal((args.synthetic, DIMENSION)).astype('float32')
+    else:
+        vectors = load_db_embeddings()
+    if len(vectors) <= args.queries:
+        raise SystemExit(f"Need more than {args.queries} vectors to benchmark, found {len(vectors)}.")
+    # The app indexes unit vectors with inner product, i.e. cosine similarity
+    vectors = normalize_rows(vectors)
+    run(vectors, args.queries, args.k, args.nlist, args.pq_m, args.hnsw_m)
@@ -0,0 +1,54 @@
+"""
+Throughput benchmark for entity extraction: the per-document extract_entities
+path versus extract_entities_batch (trimmed pipeline, nlp.pipe, optional
+multi-process).
+
+Usage:
+    python benchmark_ner.py                 # abstracts stored in the database
+    python benchmark_ner.py --docs 2000     # repeat a sample abstract 2000 times
+    python benchmark_ner.py --processes 1 2 4
+"""
+import argparse
+import time
+import nlp_engine
+
+SAMPLE_ABSTRACT = (
+    "We propose a Transformer architecture for image Classification trained on ImageNet and evaluated "
+    "on COCO Detection. Researchers at Google and Stanford University compare it with a CNN and an LSTM "
+    "baseline, reporting Accuracy, Precision, Recall and F1 Score improvements in 2023."
+)
+
+def load_db_abstracts(limit):
+    from app import app
+    from models import Document
+    with app.app_context():
+        return [row[0] for row in Document.query.with_entities(Document.abstract).limit(limit)]
+
+def timed(label, func, n_docs):
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    print(f"{label:<34} {seconds:>8.2f} s {n_docs / seconds:>10.1f} docs/s")
+    return result, seconds
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=0, help="Benchmark N copies of a sample abstract instead of the database")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2])
+    args = parser.parse_args()
+    
+    texts = [SAMPLE_ABSTRACT] * args.docs if args.docs else load_db_abstracts(5000)
+    if not texts:
+        raise SystemExit("No abstracts to benchmark.")
+    nlp_engine.load_model()
+    print(f"{len(texts)} documents, pipeline: {nlp_engine.nlp.pipe_names}\n")
+    
+    baseline, baseline_seconds = timed("per-document extract_entities", lambda: [nlp_engine.extract_entities(t) for t in texts], len(texts))
+    for n_process in args.processes:
+        batched, seconds = timed(f"extract_entities_batch n_process={n_process}",
+                                 lambda: nlp_engine.extract_entities_batch(texts, n_process=n_process, batch_size=args.batch_size),
+                                 len(texts))
+        if batched != baseline:
+            print("  WARNING: batch output differs from the per-document path")
+        print(f"  speedup: {baseline_seconds / seconds:.1f}x")
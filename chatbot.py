@@ -138,11 +138,8 @@ To cite a paper:
                         results = self.search_engine.search(clean_query, k=3)
                         if results:
                             response = f"I executed a semantic search for **'{clean_query}'** and found some relevant matches: 🔎<br><br>"
-                            for doc_id, score in results:
-                                from database import db 
-                                doc = db.session.get(Document, doc_id)
-                                if doc:
-                                    response += f"📄 <a href='/document/{doc.id}' style='color: var(--primary); text-decoration: none; font-weight: bold;'>{doc.title}</a><br>"
+                            for doc in Document.get_many([doc_id for doc_id, score in results], titles_only=True):
+                                response += f"📄 <a href='/document/{doc.id}' style='color: var(--primary); text-decoration: none; font-weight: bold;'>{doc.title}</a><br>"
                             return response
                         else:
                             return f"I searched your library for **'{clean_query}'**, but I didn't find any close matches. Try utilizing the **ArXiv Fetch** feature to add more papers on this topic! 📥"
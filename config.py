@@ -7,3 +7,66 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(BASE_DIR, 'instance', 'research_navigator.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # FAISS index snapshot (written as <path>.faiss + <path>.json) so workers skip the full rebuild
+    SEARCH_SNAPSHOT_PATH = os.environ.get('SEARCH_SNAPSHOT_PATH') or \
+        os.path.join(BASE_DIR, 'instance', 'search_index')
+    # Vector index: 'flat' (exact), 'ivf_flat', 'ivf_pq' or 'hnsw' (approximate)
+    SEARCH_INDEX_TYPE = os.environ.get('SEARCH_INDEX_TYPE') or 'flat'
+    SEARCH_NLIST = int(os.environ.get('SEARCH_NLIST') or 100)
+    SEARCH_PQ_M = int(os.environ.get('SEARCH_PQ_M') or 48)
+    SEARCH_NPROBE = int(os.environ.get('SEARCH_NPROBE') or 8)
+    SEARCH_HNSW_M = int(os.environ.get('SEARCH_HNSW_M') or 32)
+    SEARCH_EF_SEARCH = int(os.environ.get('SEARCH_EF_SEARCH') or 64)
+    # Storage format for Document.embedding: 'float32', 'float16' or 'int8'
+    EMBEDDING_DTYPE = os.environ.get('EMBEDDING_DTYPE') or 'float32'
+    SEARCH_MODEL_NAME = os.environ.get('SEARCH_MODEL_NAME') or 'all-MiniLM-L6-v2'
+    # LRU cache of query embeddings; QUERY_CACHE_SHARED adds a SQLite store shared by all workers
+    QUERY_CACHE_SIZE = int(os.environ.get('QUERY_CACHE_SIZE') or 1024)
+    QUERY_CACHE_SHARED = os.environ.get('QUERY_CACHE_SHARED', '').lower() in ('1', 'true', 'yes')
+    # Threads per web worker for background ingestion / PDF jobs
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or 2)
+    # spaCy worker processes for bulk NER; keep at 1 unless ingesting from a standalone script
+    NER_PROCESSES = int(os.environ.get('NER_PROCESSES') or 1)
+    # Search mode for the dashboard: 'hybrid' (BM25 + vectors, fused with RRF), 'semantic' or 'lexical'
+    SEARCH_MODE = os.environ.get('SEARCH_MODE') or 'hybrid'
+    # SQLite FTS5 file holding the BM25 index over titles and abstracts
+    LEXICAL_INDEX_PATH = os.environ.get('LEXICAL_INDEX_PATH') or \
+        os.path.join(BASE_DIR, 'instance', 'lexical_index.db')
+    SEARCH_RRF_K = int(os.environ.get('SEARCH_RRF_K') or 60)
+    # Search results are ranked once to SEARCH_DEEP_K and paged from a per-query cache
+    SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE') or 10)
+    SEARCH_DEEP_K = int(os.environ.get('SEARCH_DEEP_K') or 200)
+    SEARCH_RESULT_TTL = int(os.environ.get('SEARCH_RESULT_TTL') or 300)
+    # Searches drop matches whose cosine similarity to the query is below this
+    SEARCH_MIN_SIMILARITY = float(os.environ.get('SEARCH_MIN_SIMILARITY') or 0.2)
+    # e.g. unix://instance/search.sock or http://127.0.0.1:8765 to share one search_service.py
+    # process between all workers; unset loads the model and index in each worker
+    SEARCH_SERVICE_URL = os.environ.get('SEARCH_SERVICE_URL')
+    # Query encoding micro-batches: concurrent searches wait up to ENCODE_MAX_WAIT_MS to share
+    # one model call of at most ENCODE_BATCH_SIZE texts; a negative wait encodes each query alone
+    ENCODE_BATCH_SIZE = int(os.environ.get('ENCODE_BATCH_SIZE') or 32)
+    ENCODE_MAX_WAIT_MS = float(os.environ.get('ENCODE_MAX_WAIT_MS') or 2)
+    # Encoder: 'torch', 'torch_int8', 'onnx' or 'onnx_int8' (see encoders.py); ENCODER_MODEL_DIR
+    # loads the model from a local directory instead of the hub (required for the ONNX backends)
+    ENCODER_BACKEND = os.environ.get('ENCODER_BACKEND') or 'torch'
+    ENCODER_MODEL_DIR = os.environ.get('ENCODER_MODEL_DIR')
+    # PDF uploads: pages are extracted by PDF_PROCESSES worker processes and the full text is
+    # indexed as chunks of PDF_CHUNK_CHARS characters, overlapping by PDF_CHUNK_OVERLAP
+    PDF_PROCESSES = int(os.environ.get('PDF_PROCESSES') or 2)
+    PDF_CHUNK_CHARS = int(os.environ.get('PDF_CHUNK_CHARS') or 1000)
+    PDF_CHUNK_OVERLAP = int(os.environ.get('PDF_CHUNK_OVERLAP') or 200)
+    # New papers whose abstract embedding is at least this similar to a stored paper are
+    # treated as duplicates (as are papers with the same normalised title), see dedup.py
+    DEDUP_SIMILARITY = float(os.environ.get('DEDUP_SIMILARITY') or 0.95)
+    # Topic map: k-means over the paper embeddings into TOPIC_COUNT topics; new papers join the
+    # nearest topic and a full re-cluster is queued once they exceed TOPIC_RECLUSTER_FRACTION of the corpus
+    TOPIC_COUNT = int(os.environ.get('TOPIC_COUNT') or 20)
+    TOPIC_RECLUSTER_FRACTION = float(os.environ.get('TOPIC_RECLUSTER_FRACTION') or 0.25)
+    # A queued or running clustering job older than this (e.g. left behind by a killed worker)
+    # no longer blocks a new one
+    TOPIC_JOB_TIMEOUT_MINUTES = int(os.environ.get('TOPIC_JOB_TIMEOUT_MINUTES') or 120)
+    # arXiv API used by ingestion/arxiv_scheduler.py (point it at a local stub for offline runs);
+    # request starts are spaced ARXIV_REQUEST_INTERVAL seconds apart as the API terms ask
+    ARXIV_API_URL = os.environ.get('ARXIV_API_URL') or 'http://export.arxiv.org/api/query'
+    ARXIV_REQUEST_INTERVAL = float(os.environ.get('ARXIV_REQUEST_INTERVAL') or 3.0)
+    ARXIV_CONCURRENCY = int(os.environ.get('ARXIV_CONCURRENCY') or 2)
@@ -0,0 +1,170 @@
+"""
+Duplicate detection. Two papers are duplicates when their normalised titles
+hash the same, or when their abstract embeddings have a cosine similarity of
+at least DEDUP_SIMILARITY (the same paper entered by hand and fetched from
+ArXiv, say). New papers are checked at ingest; this script finds the
+duplicates already in the corpus and keeps the oldest paper of each group.
+
+Usage:
+    python dedup.py                   # backfill title hashes and report duplicate groups
+    python dedup.py --apply           # also delete the newer copies
+    python dedup.py --similarity 0.97
+"""
+import argparse
+import hashlib
+import re
+import unicodedata
+import numpy as np
+from database import db
+from models import Document
+from embedding_codec import decode_embedding
+from search_engine import normalize_rows
+
+NON_WORD = re.compile(r'[\W_]+')
+
+def normalize_title(title):
+    """Casefolded words only, so case, punctuation, accents and spacing don't hide a duplicate."""
+    text = unicodedata.normalize('NFKD', title or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return NON_WORD.sub(' ', text.casefold()).strip()
+
+def title_hash(title):
+    """SHA-1 of the normalised title, or None for an empty title."""
+    normalized = normalize_title(title)
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest() if normalized else None
+
+def load_existing_title_hashes():
+    return {h for (h,) in db.session.query(Document.title_hash).filter(Document.title_hash.isnot(None))}
+
+def stored_embeddings(doc_ids):
+    """{doc_id: unit vector} decoded from Document.embedding, for rows that have one."""
+    if not doc_ids:
+        return {}
+    rows = db.session.query(Document.id, Document.embedding) \
+        .filter(Document.id.in_(list(doc_ids)), Document.embedding.isnot(None)).all()
+    return {doc_id: normalize_rows(decode_embedding(blob))[0] for doc_id, blob in rows}
+
+def index_duplicates(engine, embeddings, threshold=0.95, k=10):
+    """
+    For each embedding, the id of the most similar stored paper at or above
+    `threshold`, or None. The index only proposes `k` candidates, which are
+    rescored exactly against their stored embeddings: compressed (PQ) scores
+    understate even identical vectors.
+    """
+    vectors = normalize_rows(embeddings)
+    candidates = engine.search_vectors(vectors, k=k)
+    stored = stored_embeddings({doc_id for row in candidates for doc_id, _ in row})
+    matches = []
+    for vector, row in zip(vectors, candidates):
+        scores = [(float(stored[doc_id] @ vector), doc_id) for doc_id, _ in row if doc_id in stored]
+        best = max(scores, default=None)
+        matches.append(best[1] if best and best[0] >= threshold else None)
+    return matches
+
+def find_duplicate(engine, title, embedding=None, threshold=0.95, trust_title=True):
+    """
+    Id of a stored paper that `title` / `embedding` duplicates, or None: an
+    indexed title-hash lookup first, then a nearest-neighbour probe of the
+    vector index. Titles guessed from text (a PDF's first line is often a
+    venue header) pass `trust_title=False` and only match by embedding.
+    """
+    fingerprint = title_hash(title)
+    if fingerprint and trust_title:
+        row = db.session.query(Document.id).filter(Document.title_hash == fingerprint).order_by(Document.id).first()
+        if row:
+            return row[0]
+    if engine is not None and embedding is not None:
+        return index_duplicates(engine, [embedding], threshold)[0]
+    return None
+
+def near_duplicates_in_batch(embeddings, threshold=0.95):
+    """Indexes of rows in a batch of unit vectors that duplicate an earlier row of the same batch."""
+    vectors = np.asarray(embeddings, dtype='float32')
+    similarities = np.triu(vectors @ vectors.T, k=1) # Row i vs later rows j > i
+    return {int(j) for j in np.nonzero((similarities >= threshold).any(axis=0))[0]}
+
+def backfill_title_hashes(batch_size=1000):
+    """Fills title_hash for rows stored before the column existed."""
+    filled = 0
+    while True:
+        rows = db.session.query(Document.id, Document.title).filter(Document.title_hash.is_(None)) \
+            .order_by(Document.id).limit(batch_size).all()
+        # Rows whose title normalises to nothing get '' so the loop moves past them
+        updates = [{"id": doc_id, "title_hash": title_hash(title) or ''} for doc_id, title in rows]
+        if not updates:
+            break
+        db.session.execute(db.update(Document), updates)
+        db.session.commit()
+        filled += len(updates)
+    if filled:
+        print(f"Backfilled title hashes for {filled} documents.")
+    return filled
+
+def find_duplicate_groups(engine=None, threshold=0.95, batch_size=1024, k=5):
+    """
+    Groups of duplicate paper ids, each sorted oldest first: equal title
+    hashes joined with pairs whose embeddings are at least `threshold`
+    similar (found with batched k-NN searches over the whole index and
+    rescored exactly). Uploaded PDFs have guessed titles, so they are only
+    grouped by embedding.
+    """
+    parent = {}
+    def find(doc_id):
+        parent.setdefault(doc_id, doc_id)
+        while parent[doc_id] != doc_id:
+            parent[doc_id] = parent[parent[doc_id]]
+            doc_id = parent[doc_id]
+        return doc_id
+    def union(a, b):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    titled = db.not_(Document.source_filter('upload'))
+    repeated = db.session.query(Document.title_hash) \
+        .filter(Document.title_hash.isnot(None), Document.title_hash != '', titled) \
+        .group_by(Document.title_hash).having(db.func.count(Document.id) > 1).subquery()
+    first_of = {}
+    for doc_id, fingerprint in db.session.query(Document.id, Document.title_hash) \
+            .filter(Document.title_hash.in_(db.select(repeated)), titled).order_by(Document.id):
+        union(first_of.setdefault(fingerprint, doc_id), doc_id)
+
+    if engine is not None:
+        doc_ids = engine.doc_ids()
+        for start in range(0, len(doc_ids), batch_size):
+            neighbours = engine.find_similar_many(doc_ids[start:start + batch_size], k)
+            stored = stored_embeddings(set(neighbours) | {related_id for related in neighbours.values()
+                                                          for related_id, _ in related})
+            for doc_id, related in neighbours.items():
+                for related_id, _ in related:
+                    if doc_id in stored and related_id in stored and \
+                            float(stored[doc_id] @ stored[related_id]) >= threshold:
+                        union(doc_id, related_id)
+
+    groups = {}
+    for doc_id in list(parent):
+        groups.setdefault(find(doc_id), []).append(doc_id)
+    return sorted(sorted(group) for group in groups.values() if len(group) > 1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apply', action='store_true', help="Delete every copy but the oldest")
+    parser.add_argument('--similarity', type=float, help="Cosine threshold (default: DEDUP_SIMILARITY)")
+    args = parser.parse_args()
+
+    from app import app, get_search_engine, delete_documents
+    with app.app_context():
+        threshold = args.similarity if args.similarity is not None else app.config['DEDUP_SIMILARITY']
+        backfill_title_hashes()
+        groups = find_duplicate_groups(get_search_engine(), threshold)
+        titles = dict(db.session.query(Document.id, Document.title)
+                      .filter(Document.id.in_([doc_id for group in groups for doc_id in group])))
+        for group in groups:
+            print(f"Keep #{group[0]} {titles.get(group[0], '')!r}")
+            for doc_id in group[1:]:
+                print(f"    duplicate #{doc_id} {titles.get(doc_id, '')!r}")
+        duplicates = [doc_id for group in groups for doc_id in group[1:]]
+        print(f"{len(groups)} duplicate groups, {len(duplicates)} papers to remove.")
+        if args.apply and duplicates:
+            delete_documents(duplicates)
+            print(f"Deleted {len(duplicates)} duplicate papers.")
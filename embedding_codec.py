@@ -0,0 +1,75 @@
+import pickle
+import struct
+import numpy as np
+
+# Stored layout: 1-byte dtype tag, then (int8 only) a float32 scale, then the raw vector bytes.
+FLOAT32 = b'f'
+FLOAT16 = b'h'
+INT8 = b'q'
+
+DTYPES = {
+    'float32': FLOAT32,
+    'float16': FLOAT16,
+    'int8': INT8
+}
+
+_NUMPY_TYPES = {
+    FLOAT32: np.float32,
+    FLOAT16: np.float16,
+    INT8: np.int8
+}
+
+def encode_embedding(vector, dtype='float32'):
+    """Serialises a vector to the compact binary format."""
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown embedding dtype '{dtype}', expected one of {tuple(DTYPES)}")
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    tag = DTYPES[dtype]
+    
+    if tag == INT8:
+        # Symmetric per-vector quantisation: x ~= q * scale
+        scale = float(np.abs(vector).max()) / 127 or 1.0
+        quantised = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+        return tag + struct.pack('<f', scale) + quantised.tobytes()
+    return tag + vector.astype(_NUMPY_TYPES[tag]).tobytes()
+
+def _unwrap_legacy(blob):
+    """Old rows hold pickled (sometimes doubly pickled) numpy arrays."""
+    value = blob
+    while isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:1]) == b'\x80':
+        value = pickle.loads(value)
+    return value
+
+def decode_into(blob, out):
+    """Decodes one stored embedding into the preallocated float32 row `out`."""
+    blob = bytes(blob) if isinstance(blob, memoryview) else blob
+    tag = blob[:1]
+    if tag == INT8:
+        scale = struct.unpack_from('<f', blob, 1)[0]
+        np.multiply(np.frombuffer(blob, dtype=np.int8, offset=5), scale, out=out, casting='unsafe')
+    elif tag in _NUMPY_TYPES:
+        out[:] = np.frombuffer(blob, dtype=_NUMPY_TYPES[tag], offset=1)
+    else:
+        out[:] = np.asarray(_unwrap_legacy(blob), dtype=np.float32).ravel()
+    return out
+
+def decode_embedding(blob):
+    """Returns a stored embedding as a float32 vector, or None if the row has none."""
+    if blob is None:
+        return None
+    tag = bytes(blob[:1])
+    if tag in _NUMPY_TYPES:
+        size = (len(blob) - (5 if tag == INT8 else 1)) // np.dtype(_NUMPY_TYPES[tag]).itemsize
+    else:
+        return np.asarray(_unwrap_legacy(blob), dtype=np.float32).ravel()
+    return decode_into(blob, np.empty(size, dtype=np.float32))
+
+def load_matrix(blobs, dimension):
+    """Decodes many stored embeddings straight into one preallocated (n, dimension) float32 matrix."""
+    matrix = np.empty((len(blobs), dimension), dtype=np.float32)
+    for i, blob in enumerate(blobs):
+        decode_into(blob, matrix[i])
+    return matrix
+
+def is_legacy(blob):
+    return blob is not None and bytes(blob[:1]) not in _NUMPY_TYPES
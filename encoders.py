@@ -0,0 +1,160 @@
+"""
+Sentence encoder backends for SearchEngine. Every backend exposes
+encode(texts, batch_size=32) -> float32 matrix, like SentenceTransformer.
+
+    torch       SentenceTransformer on PyTorch (the default)
+    torch_int8  the same model with nn.Linear layers dynamically quantised to int8
+    onnx        ONNX Runtime session over a model exported with `export`
+    onnx_int8   the exported model with int8 weights (export --quantize)
+
+Usage:
+    python encoders.py export --model all-MiniLM-L6-v2 --out models/minilm-onnx --quantize
+    python encoders.py check --backend onnx_int8 --model-dir models/minilm-onnx
+"""
+import argparse
+import json
+import os
+import numpy as np
+
+ENCODER_BACKENDS = ('torch', 'torch_int8', 'onnx', 'onnx_int8')
+ONNX_FILES = {'onnx': 'model.onnx', 'onnx_int8': 'model_int8.onnx'}
+
+def create_encoder(backend='torch', model_name='all-MiniLM-L6-v2', model_dir=None):
+    """Builds the encoder for `backend`, loading from the local `model_dir` when given."""
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}', expected one of {ENCODER_BACKENDS}")
+    if backend in ONNX_FILES:
+        if not model_dir:
+            raise ValueError(f"The '{backend}' backend needs a model directory written by `python encoders.py export`")
+        return OnnxEncoder(model_dir, ONNX_FILES[backend])
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_dir or model_name, device='cpu')
+    if backend == 'torch_int8':
+        import torch
+        # Weights become int8, activations are quantised on the fly; MiniLM is almost all Linear layers
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+class OnnxEncoder:
+    """Mean-pooled transformer embeddings from an ONNX Runtime session, matching SentenceTransformer's pooling."""
+    def __init__(self, model_dir, filename='model.onnx', threads=0):
+        try:
+            import onnxruntime
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError("The ONNX encoder needs `pip install onnxruntime transformers`") from e
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads # 0 lets ONNX Runtime use every core
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, filename), options,
+                                                    providers=['CPUExecutionProvider'])
+        self.input_names = [inp.name for inp in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_length = 256
+        config_path = os.path.join(model_dir, 'sentence_bert_config.json')
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                self.max_length = json.load(f).get('max_seq_length', self.max_length)
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        texts = list(texts)
+        chunks = []
+        for i in range(0, len(texts), batch_size):
+            batch = self.tokenizer(texts[i:i + batch_size], padding=True, truncation=True,
+                                   max_length=self.max_length, return_tensors='np')
+            feeds = {}
+            for name in self.input_names:
+                if name in batch:
+                    feeds[name] = batch[name].astype('int64')
+                else:
+                    feeds[name] = np.zeros_like(batch['input_ids'], dtype='int64') # token_type_ids
+            hidden = self.session.run(None, feeds)[0]
+            mask = batch['attention_mask'][..., None].astype('float32')
+            chunks.append((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        if not chunks:
+            return np.empty((0, self.session.get_outputs()[0].shape[-1]), dtype='float32')
+        return np.vstack(chunks).astype('float32')
+
+def export_onnx(model_name, out_dir, quantize=False, opset=14):
+    """Exports a SentenceTransformer's transformer and tokenizer to `out_dir` for OnnxEncoder."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name, device='cpu')
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    os.makedirs(out_dir, exist_ok=True)
+
+    sample = tokenizer(["A sample sentence to trace the graph."], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names + ['last_hidden_state']}
+    model_path = os.path.join(out_dir, ONNX_FILES['onnx'])
+    with torch.no_grad():
+        torch.onnx.export(transformer, tuple(sample[name] for name in input_names), model_path,
+                          input_names=input_names, output_names=['last_hidden_state'],
+                          dynamic_axes=dynamic_axes, opset_version=opset)
+    tokenizer.save_pretrained(out_dir)
+    with open(os.path.join(out_dir, 'sentence_bert_config.json'), 'w') as f:
+        json.dump({"max_seq_length": model.max_seq_length, "source_model": model_name}, f)
+    print(f"Exported {model_name} to {model_path}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantized_path = os.path.join(out_dir, ONNX_FILES['onnx_int8'])
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        print(f"Wrote int8 model to {quantized_path}")
+
+def cosine_agreement(reference, candidate, texts, batch_size=32):
+    """Per-text cosine similarity between two encoders' embeddings of the same texts."""
+    a = np.asarray(reference.encode(texts, batch_size=batch_size), dtype='float32')
+    b = np.asarray(candidate.encode(texts, batch_size=batch_size), dtype='float32')
+    a /= np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b /= np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return (a * b).sum(axis=1)
+
+def sample_texts(limit=500):
+    """Stored abstracts and titles (the text the encoder actually sees), or built-in sentences without a database."""
+    try:
+        from app import app
+        from models import Document
+        with app.app_context():
+            rows = Document.query.with_entities(Document.title, Document.abstract).limit(limit // 2).all()
+        texts = [text for row in rows for text in row]
+    except Exception as e:
+        print(f"Could not read documents ({e}); using built-in sentences.")
+        texts = []
+    return texts or [
+        "graph neural networks for molecule property prediction",
+        "A Transformer architecture for image classification trained on ImageNet.",
+        "reinforcement learning", "BERT", "diffusion models for speech synthesis",
+        "We study federated learning under non-IID client data and propose a new aggregation rule."
+    ]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help="Export a SentenceTransformer to ONNX")
+    export.add_argument('--model', default='all-MiniLM-L6-v2')
+    export.add_argument('--out', required=True)
+    export.add_argument('--quantize', action='store_true', help="Also write an int8 model_int8.onnx")
+    check = commands.add_parser('check', help="Compare a backend's embeddings with the torch backend")
+    check.add_argument('--backend', choices=ENCODER_BACKENDS, required=True)
+    check.add_argument('--model', default='all-MiniLM-L6-v2')
+    check.add_argument('--model-dir')
+    check.add_argument('--min-cosine', type=float, default=0.99)
+    check.add_argument('--limit', type=int, default=500)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export_onnx(args.model, args.out, quantize=args.quantize)
+    else:
+        texts = sample_texts(args.limit)
+        reference = create_encoder('torch', args.model)
+        candidate = create_encoder(args.backend, args.model, args.model_dir)
+        cosines = cosine_agreement(reference, candidate, texts)
+        print(f"{args.backend} vs torch on {len(texts)} texts: mean cosine {cosines.mean():.5f}, "
+              f"min {cosines.min():.5f}, p1 {np.percentile(cosines, 1):.5f}")
+        if cosines.min() < args.min_cosine:
+            raise SystemExit(f"FAIL: {int((cosines < args.min_cosine).sum())} texts below cosine {args.min_cosine}")
+        print("OK")
@@ -23,5 +23,22 @@ def migrate():
         except Exception as e:
             print(f"bio column might already exist or error: {e}")
 
+        try:
+            with db.engine.connect() as conn:
+                conn.execute(text("ALTER TABLE document ADD COLUMN title_hash VARCHAR(40)"))
+                conn.commit()
+            print("Added title_hash column.")
+        except Exception as e:
+            print(f"title_hash column might already exist or error: {e}")
+
+        # Indexes added to existing tables (create_all only indexes new ones)
+        from models import Document
+        for index in Document.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+            print(f"Ensured index {index.name}.")
+            
+        from dedup import backfill_title_hashes
+        backfill_title_hashes()
+
 if __name__ == '__main__':
     migrate()
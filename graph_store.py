@@ -0,0 +1,234 @@
+import re
+import unicodedata
+from collections import Counter
+from sqlalchemy import bindparam, insert, tuple_, update
+from database import db
+from models import Document, Entity, Concept, DocumentConcept, GraphState
+
+EDGE_PUNCTUATION = " \t\n.,;:!?'\"()[]{}"
+WHITESPACE = re.compile(r'\s+')
+
+def normalize_concept(text):
+    """Canonical form used to merge entity mentions: NFKC, case-folded, single-spaced, trimmed of edge punctuation."""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return WHITESPACE.sub(' ', text).strip(EDGE_PUNCTUATION)
+
+def _insert_ignore(model):
+    """INSERT that skips rows violating a unique constraint (another worker may insert the same concept)."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(model).prefix_with('IGNORE')
+    return dialect_insert(model).on_conflict_do_nothing()
+
+def graph_version():
+    state = db.session.get(GraphState, 1)
+    return state.version if state else None
+
+def _bump_version():
+    db.session.execute(update(GraphState.__table__).where(GraphState.id == 1).values(version=GraphState.version + 1))
+
+def add_document_concepts(doc_entities):
+    """
+    Adds graph edges for newly ingested documents. `doc_entities` maps doc_id to
+    its [(text, label)] entities. Runs in the caller's transaction; commit after.
+    """
+    if graph_version() is None:
+        return # Not materialised yet; ensure_graph() will backfill from the Entity table
+        
+    edges = set()
+    first_seen = {}
+    for doc_id, entities in doc_entities.items():
+        for text, label in entities:
+            text = text[:95] + "..." if len(text) > 100 else text # Same truncation as Entity.text
+            norm_text = normalize_concept(text)
+            if not norm_text:
+                continue
+            key = (norm_text, label)
+            first_seen.setdefault(key, text)
+            edges.add((doc_id, key))
+    if not edges:
+        return
+        
+    db.session.execute(_insert_ignore(Concept.__table__), [
+        {"norm_text": norm_text, "label": label, "text": text, "doc_count": 0}
+        for (norm_text, label), text in first_seen.items()
+    ])
+    ids = {}
+    keys = list(first_seen)
+    for i in range(0, len(keys), 400): # Stay well under SQLite's bound-parameter limit
+        rows = db.session.query(Concept.norm_text, Concept.label, Concept.id) \
+            .filter(tuple_(Concept.norm_text, Concept.label).in_(keys[i:i + 400]))
+        ids.update(((norm_text, label), cid) for norm_text, label, cid in rows)
+    
+    db.session.execute(_insert_ignore(DocumentConcept.__table__), [
+        {"doc_id": doc_id, "concept_id": ids[key]} for doc_id, key in edges
+    ])
+    degree = Counter(ids[key] for _, key in edges)
+    concept_table = Concept.__table__
+    db.session.execute(update(concept_table).where(concept_table.c.id == bindparam('cid'))
+                       .values(doc_count=concept_table.c.doc_count + bindparam('n')),
+                       [{"cid": cid, "n": n} for cid, n in degree.items()])
+    _bump_version()
+
+def remove_document_concepts(doc_id):
+    """Drops a document's edges and any concept left without papers. Commit after."""
+    if graph_version() is None:
+        return
+    concept_ids = [cid for (cid,) in db.session.query(DocumentConcept.concept_id).filter_by(doc_id=doc_id)]
+    if not concept_ids:
+        return
+    DocumentConcept.query.filter_by(doc_id=doc_id).delete()
+    Concept.query.filter(Concept.id.in_(concept_ids)).update(
+        {Concept.doc_count: Concept.doc_count - 1}, synchronize_session=False)
+    Concept.query.filter(Concept.id.in_(concept_ids), Concept.doc_count <= 0).delete(synchronize_session=False)
+    _bump_version()
+
+def rebuild_graph(batch_size=1000):
+    """Rebuilds the materialised graph from the Entity table (backfill for existing databases)."""
+    print("Rebuilding knowledge graph...")
+    DocumentConcept.query.delete()
+    Concept.query.delete()
+    if graph_version() is None:
+        db.session.add(GraphState(id=1, version=0))
+        db.session.flush()
+    last_id = 0
+    while True:
+        doc_ids = [doc_id for (doc_id,) in db.session.query(Document.id).filter(Document.id > last_id)
+                   .order_by(Document.id).limit(batch_size)]
+        if not doc_ids:
+            break
+        last_id = doc_ids[-1]
+        doc_entities = {doc_id: [] for doc_id in doc_ids}
+        for doc_id, text, label in db.session.query(Entity.doc_id, Entity.text, Entity.label) \
+                .filter(Entity.doc_id.in_(doc_ids)).order_by(Entity.id):
+            doc_entities[doc_id].append((text, label))
+        add_document_concepts(doc_entities)
+    _bump_version()
+    db.session.commit()
+    print(f"Knowledge graph has {Concept.query.count()} concepts and {DocumentConcept.query.count()} edges.")
+
+def ensure_graph():
+    """Backfills the graph once for databases created before it was materialised."""
+    if graph_version() is None:
+        rebuild_graph()
+
+def find_concept(text, label=None):
+    """Concepts matching `text` after normalisation (one per label unless `label` is given)."""
+    query = Concept.query.filter(Concept.norm_text == normalize_concept(text))
+    if label:
+        query = query.filter(Concept.label == label)
+    return query.order_by(Concept.doc_count.desc()).all()
+
+def papers_mentioning(text, label=None, limit=50):
+    """Documents mentioning a concept, newest first; an index lookup instead of a scan of Entity."""
+    concept_ids = [concept.id for concept in find_concept(text, label)]
+    if not concept_ids:
+        return []
+    doc_ids = db.session.query(DocumentConcept.doc_id).filter(DocumentConcept.concept_id.in_(concept_ids)).distinct()
+    return Document.query.options(db.defer(Document.embedding)).filter(Document.id.in_(doc_ids)) \
+        .order_by(Document.ingestion_date.desc()).limit(limit).all()
+
+def top_concepts(limit=20, label=None):
+    """Most widely mentioned concepts, read straight off the doc_count index."""
+    query = Concept.query
+    if label:
+        query = query.filter(Concept.label == label)
+    return query.order_by(Concept.doc_count.desc(), Concept.id).limit(limit).all()
+
+def concept_dict(concept):
+    return {"id": concept.id, "text": concept.text, "label": concept.label, "papers": concept.doc_count}
+
+def _paper_node(doc_id, title):
+    # Truncate title for label
+    return {
+        "id": f"doc_{doc_id}",
+        "label": title[:30] + "..." if len(title) > 30 else title,
+        "group": "paper",
+        "title": title # Tooltip
+    }
+
+def _concept_node(concept):
+    return {
+        "id": f"conc_{concept.id}",
+        "label": concept.text,
+        "group": "entity", # We could use concept.label for color groups later
+        "color": "#e0e7ff", # Light indigo default
+        "title": f"{concept.label} · {concept.doc_count} papers"
+    }
+
+def _assemble(concepts, edge_rows):
+    """Builds vis.js nodes/edges for the given concepts and (doc_id, concept_id) edges."""
+    doc_ids = sorted({doc_id for doc_id, _ in edge_rows})
+    titles = dict(db.session.query(Document.id, Document.title).filter(Document.id.in_(doc_ids))) if doc_ids else {}
+    nodes = [_paper_node(doc_id, titles[doc_id]) for doc_id in doc_ids if doc_id in titles]
+    nodes += [_concept_node(concept) for concept in concepts]
+    edges = [{"from": f"doc_{doc_id}", "to": f"conc_{concept_id}"} for doc_id, concept_id in edge_rows if doc_id in titles]
+    return nodes, edges
+
+def graph_page(page=1, per_page=200, label=None, min_degree=1, papers_per_concept=20):
+    """
+    One page of the graph: concepts ordered by degree (most connected first),
+    optionally restricted to an entity label and a minimum degree, plus up to
+    `papers_per_concept` of the newest papers each connects to. The cap keeps
+    a page's size bounded however large the top concepts grow.
+    """
+    query = Concept.query.filter(Concept.doc_count >= min_degree)
+    if label:
+        query = query.filter(Concept.label == label)
+    total = query.count()
+    concepts = query.order_by(Concept.doc_count.desc(), Concept.id).offset((page - 1) * per_page).limit(per_page).all()
+    
+    edge_rows = []
+    if concepts:
+        # Windowed LIMIT per concept, read off the (concept_id, doc_id) index
+        ranked = db.session.query(
+            DocumentConcept.doc_id, DocumentConcept.concept_id,
+            db.func.row_number().over(partition_by=DocumentConcept.concept_id,
+                                      order_by=DocumentConcept.doc_id.desc()).label('rank')
+        ).filter(DocumentConcept.concept_id.in_([c.id for c in concepts])).subquery()
+        edge_rows = db.session.query(ranked.c.doc_id, ranked.c.concept_id) \
+            .filter(ranked.c.rank <= papers_per_concept).all()
+    nodes, edges = _assemble(concepts, edge_rows)
+    return {
+        "nodes": nodes,
+        "edges": edges,
+        "page": page,
+        "per_page": per_page,
+        "papers_per_concept": papers_per_concept,
+        "total_concepts": total,
+        "has_more": page * per_page < total
+    }
+
+def ego_graph(doc_id=None, concept_id=None, limit=100):
+    """
+    Neighbourhood of one paper (its concepts and papers sharing them) or of one
+    concept (its papers and their other concepts), capped at `limit` edges per hop.
+    """
+    if doc_id is not None:
+        concept_ids = [cid for (cid,) in db.session.query(DocumentConcept.concept_id).filter_by(doc_id=doc_id)]
+    else:
+        doc_ids = [did for (did,) in db.session.query(DocumentConcept.doc_id).filter_by(concept_id=concept_id).limit(limit)]
+        concept_ids = [concept_id]
+        if doc_ids:
+            concept_ids += [cid for (cid,) in db.session.query(DocumentConcept.concept_id)
+                            .filter(DocumentConcept.doc_id.in_(doc_ids), DocumentConcept.concept_id != concept_id)
+                            .limit(limit)]
+    if not concept_ids:
+        return {"nodes": [], "edges": []}
+        
+    concepts = Concept.query.filter(Concept.id.in_(concept_ids)).all()
+    edge_rows = set(db.session.query(DocumentConcept.doc_id, DocumentConcept.concept_id)
+                    .filter(DocumentConcept.concept_id.in_(concept_ids)).limit(limit).all())
+    if doc_id is not None:
+        edge_rows.update((doc_id, cid) for cid in concept_ids)
+    nodes, edges = _assemble(concepts, sorted(edge_rows))
+    return {"nodes": nodes, "edges": edges}
+
+if __name__ == '__main__':
+    from app import app
+    with app.app_context():
+        rebuild_graph()
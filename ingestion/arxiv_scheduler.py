@@ -0,0 +1,280 @@
+"""
+Async arXiv backfill. Pages through the arXiv API for many queries or
+categories at once: fetches overlap up to a concurrency limit, but request
+starts are spaced by the API's rate limit (one every 3 seconds). A single
+consumer ingests pages in order through ingest_records, which commits per
+chunk, and after each page records a per-query checkpoint so an
+interrupted run resumes where it stopped.
+
+Usage:
+    python -m ingestion.arxiv_scheduler "graph neural networks" --category cs.LG --max-results 2000
+    python -m ingestion.arxiv_scheduler --category cs.CL --restart          # ignore the checkpoint
+    python -m ingestion.arxiv_scheduler --category cs.CL --record feeds/    # also save the Atom pages
+    python -m ingestion.arxiv_scheduler --category cs.CL --feed-dir feeds/  # replay saved pages offline
+    ARXIV_REQUEST_INTERVAL=0 python -m ingestion.arxiv_scheduler --category cs.CL --api-url http://127.0.0.1:8000/api/query
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+import requests
+from database import db
+from models import ArxivCheckpoint
+from dedup import load_existing_title_hashes
+from ingestion.pipeline import ingest_records, load_existing_urls
+
+API_URL = 'http://export.arxiv.org/api/query'
+NAMESPACES = {
+    'atom': 'http://www.w3.org/2005/Atom',
+    'opensearch': 'http://a9.com/-/spec/opensearch/1.1/'
+}
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class FeedError(Exception):
+    pass
+
+def parse_feed(xml):
+    """Atom page -> (total results, [record]) with the fields ingest_records expects."""
+    try:
+        root = ET.fromstring(xml)
+    except ET.ParseError as e:
+        raise FeedError(f"Malformed Atom feed: {e}")
+    total = root.findtext('opensearch:totalResults', default='0', namespaces=NAMESPACES)
+    records = []
+    for entry in root.findall('atom:entry', NAMESPACES):
+        entry_id = (entry.findtext('atom:id', default='', namespaces=NAMESPACES) or '').strip()
+        title = ' '.join((entry.findtext('atom:title', default='', namespaces=NAMESPACES) or '').split())
+        if not entry_id or not title:
+            continue # The API reports errors as an entry without these
+        published = entry.findtext('atom:published', namespaces=NAMESPACES)
+        records.append({
+            "title": title,
+            "abstract": ' '.join((entry.findtext('atom:summary', default='', namespaces=NAMESPACES) or '').split()),
+            "source_url": entry_id, # Same entry_id the arxiv client returns, so URL dedup still matches
+            "published_date": datetime.strptime(published.strip(), '%Y-%m-%dT%H:%M:%SZ') if published else None
+        })
+    return int(total), records
+
+def feed_filename(query, start):
+    slug = hashlib.sha1(query.encode('utf-8')).hexdigest()[:12]
+    return f"{slug}_{start}.xml"
+
+class RateLimiter:
+    """Spaces request starts at least `interval` seconds apart across all tasks."""
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = asyncio.Lock()
+        self.next_start = 0.0
+
+    async def wait(self):
+        async with self.lock:
+            delay = self.next_start - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_start = time.monotonic() + self.interval
+
+class HttpFeed:
+    """Fetches Atom pages from the arXiv API (or a local stub at `api_url`), optionally saving them to `record_dir`."""
+    def __init__(self, api_url=API_URL, interval=3.0, concurrency=2, retries=4, timeout=60, record_dir=None):
+        self.api_url = api_url
+        self.limiter = RateLimiter(interval)
+        self.slots = asyncio.Semaphore(concurrency)
+        self.retries = retries
+        self.timeout = timeout
+        self.record_dir = record_dir
+        self.session = requests.Session()
+
+    async def fetch(self, query, start, page_size):
+        params = {"search_query": query, "start": start, "max_results": page_size,
+                  "sortBy": "submittedDate", "sortOrder": "descending"}
+        for attempt in range(self.retries + 1):
+            async with self.slots:
+                await self.limiter.wait()
+                try:
+                    response = await asyncio.to_thread(self.session.get, self.api_url, params=params,
+                                                       timeout=self.timeout)
+                    error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+                    retryable = response.status_code in RETRY_STATUSES
+                except requests.RequestException as e:
+                    error, retryable = str(e), True
+            if error is None:
+                break
+            if not retryable or attempt == self.retries:
+                raise FeedError(f'"{query}" at {start}: {error}')
+            backoff = self.limiter.interval * 2 ** attempt
+            print(f'arXiv request for "{query}" at {start} failed ({error}), retrying in {backoff:g}s')
+            await asyncio.sleep(backoff)
+
+        if self.record_dir:
+            os.makedirs(self.record_dir, exist_ok=True)
+            with open(os.path.join(self.record_dir, feed_filename(query, start)), 'wb') as f:
+                f.write(response.content)
+        return response.content
+
+class RecordedFeed:
+    """Replays pages saved with --record, for offline runs. Missing pages read as empty."""
+    def __init__(self, feed_dir):
+        self.feed_dir = feed_dir
+
+    async def fetch(self, query, start, page_size):
+        path = os.path.join(self.feed_dir, feed_filename(query, start))
+        if not os.path.exists(path):
+            return b'<feed xmlns="http://www.w3.org/2005/Atom"></feed>'
+        with open(path, 'rb') as f:
+            return f.read()
+
+async def _produce(feed, query, start, max_results, page_size, pages, empty_retries=2):
+    """Pages through one query in order, handing (query, start, total, records) to the consumer."""
+    empty = 0
+    while start < max_results:
+        total, records = parse_feed(await feed.fetch(query, start, min(page_size, max_results - start)))
+        if not records and start < total and empty < empty_retries:
+            empty += 1 # The API sometimes returns a spurious empty page mid-results
+            continue
+        await pages.put((query, start, total, records))
+        if not records:
+            return
+        empty = 0
+        start += len(records)
+        if start >= total:
+            return
+
+def _ingest_page(app, engine, known, page, batch_size, max_results, checkpoint):
+    """
+    Runs in a worker thread: ingests one page, then moves the query's
+    checkpoint past it. `known` carries the URL and title sets between pages.
+    If storing fails the error propagates before the checkpoint moves, so a
+    rerun fetches the page again.
+    """
+    query, start, total, records = page
+    with app.app_context():
+        if not known:
+            known.update(urls=load_existing_urls(), titles=load_existing_title_hashes())
+        count = ingest_records(records, engine=engine, batch_size=batch_size,
+                               existing_urls=known['urls'], existing_titles=known['titles'],
+                               embedding_dtype=app.config['EMBEDDING_DTYPE'],
+                               ner_processes=app.config['NER_PROCESSES'],
+                               dedup_similarity=app.config['DEDUP_SIMILARITY']) if records else 0
+        if checkpoint:
+            state = db.session.get(ArxivCheckpoint, query) or ArxivCheckpoint(search_query=query, ingested=0)
+            state.next_start = start + len(records)
+            state.total_results = total
+            state.ingested += count
+            state.done = not records or state.next_start >= min(total, max_results)
+            state.updated_at = datetime.utcnow()
+            db.session.add(state)
+            db.session.commit()
+        return count
+
+def _start_offsets(app, queries, resume):
+    """Offset to resume each query from; queries already finished are left out."""
+    with app.app_context():
+        checkpoints = {c.search_query: c for c in ArxivCheckpoint.query.filter(ArxivCheckpoint.search_query.in_(queries))}
+        if not resume:
+            for checkpoint in checkpoints.values():
+                db.session.delete(checkpoint)
+            db.session.commit()
+            return {query: 0 for query in queries}
+    offsets = {}
+    for query in queries:
+        checkpoint = checkpoints.get(query)
+        if checkpoint is None:
+            offsets[query] = 0
+        elif not checkpoint.done:
+            # Results are newest first, so papers submitted since only push old ones to later
+            # offsets: resuming re-reads a few (dropped as duplicates) but never skips any
+            offsets[query] = checkpoint.next_start
+    return offsets
+
+async def run_async(app, queries, feed, engine=None, max_results=1000, page_size=100, batch_size=100,
+                    resume=True, checkpoint=True, on_batch=None, prefetch=4):
+    """
+    Fetches every query concurrently through `feed` and ingests the pages
+    one at a time as they arrive. Without `checkpoint` every query starts
+    from the newest result and no progress is stored (one-off fetches).
+    Returns the number of new documents.
+    """
+    with app.app_context():
+        db.create_all()
+    if checkpoint:
+        offsets = _start_offsets(app, list(queries), resume)
+    else:
+        offsets = {query: 0 for query in queries}
+    for query in queries:
+        if query not in offsets:
+            print(f'"{query}" already completed, skipping (use --restart to fetch it again).')
+    if not offsets:
+        return 0
+
+    pages = asyncio.Queue(maxsize=prefetch) # Bounds how far fetching runs ahead of ingestion
+    producers = [asyncio.create_task(_produce(feed, query, start, max_results, page_size, pages))
+                 for query, start in offsets.items()]
+    # One failing query doesn't stop the others; its checkpoint lets a rerun pick it up
+    fetching = asyncio.gather(*producers, return_exceptions=True)
+    known = {}
+    total = 0
+    try:
+        while not (fetching.done() and pages.empty()):
+            getter = asyncio.ensure_future(pages.get())
+            await asyncio.wait([getter, fetching], return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                getter.cancel()
+                continue
+            page = getter.result()
+            total += await asyncio.to_thread(_ingest_page, app, engine, known, page, batch_size, max_results,
+                                             checkpoint)
+            query, start, total_results, records = page
+            print(f'"{query}": {start + len(records)}/{min(total_results, max_results)} results read, '
+                  f'{total} new papers in total.')
+            if on_batch:
+                on_batch(total)
+    finally:
+        for producer in producers:
+            producer.cancel()
+            
+    errors = [(query, error) for query, error in zip(offsets, fetching.result()) if isinstance(error, Exception)]
+    for query, error in errors:
+        print(f'Fetching "{query}" failed: {error}')
+    if errors:
+        raise FeedError(f"{len(errors)} of {len(offsets)} queries failed after ingesting {total} papers; "
+                        f"run again to resume them.")
+    return total
+
+def run(app, queries, feed=None, **kwargs):
+    """Synchronous entry point for scripts and background jobs."""
+    async def main():
+        return await run_async(app, queries, feed or HttpFeed(
+            api_url=app.config['ARXIV_API_URL'], interval=app.config['ARXIV_REQUEST_INTERVAL'],
+            concurrency=app.config['ARXIV_CONCURRENCY']), **kwargs)
+    return asyncio.run(main())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('queries', nargs='*', help="arXiv search queries, e.g. 'all:transformers'")
+    parser.add_argument('--category', action='append', default=[], help="arXiv category, e.g. cs.LG (repeatable)")
+    parser.add_argument('--max-results', type=int, default=1000, help="Per query")
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=100, help="Papers per database commit")
+    parser.add_argument('--restart', action='store_true', help="Discard checkpoints and start from the newest results")
+    parser.add_argument('--api-url', help="API endpoint (default: ARXIV_API_URL)")
+    parser.add_argument('--feed-dir', help="Replay Atom pages saved with --record instead of calling the API")
+    parser.add_argument('--record', help="Save every fetched Atom page to this directory")
+    args = parser.parse_args()
+
+    queries = args.queries + [f"cat:{category}" for category in args.category]
+    if not queries:
+        parser.error("Give at least one query or --category")
+
+    from app import app, get_search_engine
+    if args.feed_dir:
+        feed = RecordedFeed(args.feed_dir)
+    else:
+        feed = HttpFeed(api_url=args.api_url or app.config['ARXIV_API_URL'],
+                        interval=app.config['ARXIV_REQUEST_INTERVAL'],
+                        concurrency=app.config['ARXIV_CONCURRENCY'], record_dir=args.record)
+    count = asyncio.run(run_async(app, queries, feed, engine=get_search_engine(), max_results=args.max_results,
+                                  page_size=args.page_size, batch_size=args.batch_size, resume=not args.restart))
+    print(f"Ingested {count} new papers.")
@@ -0,0 +1,154 @@
+from itertools import islice
+from sqlalchemy import insert
+from database import db
+from models import Document, Entity
+from embedding_codec import encode_embedding
+import nlp_engine
+import graph_store
+import related_papers
+import topics
+from dedup import title_hash, load_existing_title_hashes, near_duplicates_in_batch, index_duplicates
+
+def truncate(text, limit):
+    """Same truncation rule the forms and fetchers use for bounded columns."""
+    return text[:limit - 5] + "..." if len(text) > limit else text
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def load_existing_urls():
+    """Preloads every known source_url so duplicate checks are set lookups, not queries."""
+    return {url for (url,) in db.session.query(Document.source_url).filter(Document.source_url.isnot(None))}
+
+def ingest_records(records, engine=None, batch_size=100, existing_urls=None, embedding_dtype='float32',
+                   ner_processes=1, on_batch=None, dedup_similarity=0.95, existing_titles=None):
+    """
+    Streams paper records (dicts with title, abstract, source_url, published_date)
+    into the database in chunks. Each chunk is deduplicated against known
+    source_urls and normalised titles, embedded in one batch, cut down to the
+    records with no near-duplicate (cosine >= `dedup_similarity`) in the index
+    or earlier in the batch, run through NER in one batch, bulk-inserted in a
+    single transaction together with the live search index.
+    
+    A chunk that fails to store is rolled back, unindexed and the error
+    re-raised, so callers never move past papers that were not saved. The
+    known URL and title sets only grow once a chunk is committed.
+    
+    Must run inside an app context. Returns the number of new documents.
+    """
+    if existing_urls is None:
+        existing_urls = load_existing_urls()
+    if existing_titles is None:
+        existing_titles = load_existing_title_hashes()
+        
+    total = 0
+    for batch in batched(records, batch_size):
+        fresh = []
+        batch_urls, batch_titles = set(), set() # Repeats within the chunk
+        for record in batch:
+            url = record.get('source_url')
+            fingerprint = title_hash(truncate(record['title'], 300))
+            if (url and (url in existing_urls or url in batch_urls)) or \
+                    (fingerprint and (fingerprint in existing_titles or fingerprint in batch_titles)):
+                continue
+            if url:
+                batch_urls.add(url)
+            if fingerprint:
+                batch_titles.add(fingerprint)
+            record['title_hash'] = fingerprint
+            fresh.append(record)
+        if len(fresh) < len(batch):
+            print(f"Skipping {len(batch) - len(fresh)} existing papers.")
+        if not fresh:
+            continue
+            
+        abstracts = [truncate(record['abstract'], 5000) for record in fresh]
+        
+        embeddings = None
+        if engine:
+            try:
+                embeddings = engine.bulk_encode(abstracts)
+            except Exception as e:
+                print(f"Embedding failed: {e}")
+                
+        if embeddings is not None:
+            # Near-duplicates: same paper under a different title or URL
+            duplicates = near_duplicates_in_batch(embeddings, dedup_similarity)
+            matches = index_duplicates(engine, embeddings, dedup_similarity)
+            duplicates.update(i for i, match in enumerate(matches) if match is not None)
+            if duplicates:
+                print(f"Skipping {len(duplicates)} near-duplicate papers.")
+                keep = [i for i in range(len(fresh)) if i not in duplicates]
+                fresh = [fresh[i] for i in keep]
+                abstracts = [abstracts[i] for i in keep]
+                embeddings = embeddings[keep]
+            if not fresh:
+                continue
+                
+        try:
+            entities = nlp_engine.extract_entities_batch(abstracts, n_process=ner_processes)
+        except Exception as e:
+            print(f"Entity extraction failed: {e}")
+            entities = [[] for _ in fresh]
+            
+        indexed = False
+        try:
+            docs = []
+            for i, record in enumerate(fresh):
+                docs.append(Document(
+                    title=truncate(record['title'], 300),
+                    title_hash=record['title_hash'],
+                    abstract=abstracts[i],
+                    source_url=record.get('source_url'),
+                    published_date=record.get('published_date'),
+                    embedding=encode_embedding(embeddings[i], embedding_dtype) if embeddings is not None else None
+                ))
+            db.session.add_all(docs)
+            db.session.flush() # Assigns ids in one multi-row INSERT
+            
+            entity_rows = [
+                {"text": truncate(text, 100), "label": label, "doc_id": doc.id}
+                for doc, extracted in zip(docs, entities)
+                for text, label in extracted
+            ]
+            if entity_rows:
+                db.session.execute(insert(Entity), entity_rows)
+            graph_store.add_document_concepts({doc.id: extracted for doc, extracted in zip(docs, entities)})
+            doc_ids = [doc.id for doc in docs] # Read before commit expires the objects
+            if engine and embeddings is not None:
+                # Indexed before the commit, so an index failure rolls the chunk back instead of
+                # leaving stored papers that searches never find
+                texts = [(doc.title, doc.abstract) for doc in docs]
+                engine.add_documents(doc_ids, embeddings, texts=texts)
+                indexed = True
+            db.session.commit()
+        except Exception as e:
+            print(f"Failed to store batch of {len(fresh)} papers: {e}")
+            db.session.rollback()
+            if indexed:
+                for doc_id in doc_ids:
+                    engine.remove_document(doc_id)
+            raise
+        existing_urls.update(batch_urls)
+        existing_titles.update(batch_titles)
+            
+        if indexed:
+            try:
+                related_papers.add_documents(engine, doc_ids)
+                topics.assign_documents(engine, doc_ids)
+                db.session.commit()
+            except Exception as e:
+                print(f"Failed to update related papers and topics: {e}")
+                db.session.rollback()
+            
+        total += len(doc_ids)
+        print(f"Ingested {total} new papers so far...")
+        if on_batch:
+            on_batch(total)
+            
+    return total
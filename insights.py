@@ -0,0 +1,52 @@
+import hashlib
+import traceback
+from sqlalchemy.exc import IntegrityError
+from database import db
+from models import DocumentInsight
+import nlp_engine
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def compute_insight(doc):
+    """Runs the NLP work for a document. Raises if summarisation fails."""
+    return DocumentInsight(
+        doc_id=doc.id,
+        content_hash=content_hash(doc.abstract),
+        summary=nlp_engine.generate_summary(doc.abstract),
+        top_terms=nlp_engine.top_terms(doc.abstract)
+    )
+
+def get_document_insight(doc):
+    """
+    Returns the stored DocumentInsight for `doc`, computing and saving it on
+    first view or when the abstract changed. If summarisation fails, a
+    placeholder is returned and nothing is stored, so the next view retries.
+    """
+    insight = db.session.get(DocumentInsight, doc.id)
+    digest = content_hash(doc.abstract)
+    if insight and insight.content_hash == digest:
+        return insight
+        
+    try:
+        fresh = compute_insight(doc)
+    except Exception as e:
+        print(f"ERROR summarizing {doc.title}: {e}")
+        traceback.print_exc()
+        return DocumentInsight(doc_id=doc.id, content_hash=digest, summary="Summary generation unavailable.",
+                               top_terms=nlp_engine.top_terms(doc.abstract))
+        
+    if insight:
+        insight.content_hash = fresh.content_hash
+        insight.summary = fresh.summary
+        insight.top_terms = fresh.top_terms
+    else:
+        insight = fresh
+        db.session.add(insight)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored it first; its result is identical
+        db.session.rollback()
+        insight = db.session.get(DocumentInsight, doc.id) or fresh
+    return insight
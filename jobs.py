@@ -0,0 +1,53 @@
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from database import db
+from models import Job
+
+class JobQueue:
+    """
+    Runs long tasks (ArXiv ingestion, PDF processing) on a small in-process
+    thread pool so request handlers can return immediately. Job state lives in
+    the `job` table, so any gunicorn worker can answer status requests.
+    """
+    def __init__(self, app, max_workers=2):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        
+    def enqueue(self, kind, func, *args, user_id=None, total=None, **kwargs):
+        """
+        Records a queued Job and schedules func(progress, *args, **kwargs).
+        `progress(done, total=None, message=None)` updates the job row; the
+        function's return value is stored as the job result. Returns the job id.
+        """
+        job = Job(kind=kind, status='queued', total=total, user_id=user_id)
+        db.session.add(job)
+        db.session.commit()
+        self.executor.submit(self._run, job.id, func, args, kwargs)
+        return job.id
+    
+    def _run(self, job_id, func, args, kwargs):
+        with self.app.app_context():
+            self._update(job_id, status='running', started_at=datetime.utcnow())
+            
+            def progress(done, total=None, message=None):
+                fields = {"progress": done}
+                if total is not None:
+                    fields["total"] = total
+                if message is not None:
+                    fields["message"] = message[:500]
+                self._update(job_id, **fields)
+                
+            try:
+                result = func(progress, *args, **kwargs)
+                self._update(job_id, status='done', result=result, finished_at=datetime.utcnow())
+            except Exception as e:
+                traceback.print_exc()
+                db.session.rollback()
+                self._update(job_id, status='failed', message=str(e)[:500], finished_at=datetime.utcnow())
+            finally:
+                db.session.remove()
+                
+    def _update(self, job_id, **fields):
+        db.session.query(Job).filter_by(id=job_id).update(fields)
+        db.session.commit()
@@ -0,0 +1,112 @@
+import json
+import re
+import sqlite3
+import threading
+
+TOKEN_PATTERN = re.compile(r'\w+')
+# Model and dataset names: BERT, ResNet-50, GPT-4, ImageNet, CIFAR_10
+IDENTIFIER_PATTERN = re.compile(r'^(?:[A-Z0-9]{2,}|\w*[a-z][A-Z]\w*|\w*[A-Za-z][-_]?\d[\w-]*)$')
+
+def is_keyword_query(query):
+    """True for short exact-term lookups (quoted phrases or model/dataset names) that need no embedding."""
+    query = query.strip()
+    if len(query) > 2 and query[0] == query[-1] == '"':
+        return True
+    words = query.split()
+    return 0 < len(words) <= 3 and all(IDENTIFIER_PATTERN.match(word) for word in words)
+
+def match_expression(query, phrase=False):
+    """FTS5 MATCH string for free text: every token quoted, so user input can't inject FTS syntax."""
+    tokens = TOKEN_PATTERN.findall(query.lower())
+    if not tokens:
+        return None
+    if phrase:
+        return '"' + ' '.join(tokens) + '"'
+    return ' OR '.join(f'"{token}"' for token in tokens)
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuses ranked lists of (doc_id, score) with RRF: each list contributes
+    1 / (k + rank) per document. Only ranks are used, so BM25 scores and
+    cosine similarities never have to be put on the same scale.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, (doc_id, _) in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+class LexicalIndex:
+    """
+    BM25 index over paper titles and abstracts, stored as an SQLite FTS5 table.
+    Like the shared query cache it lives in its own file, so it works whatever
+    database backs the app and every worker sees the same index.
+    """
+    def __init__(self, path, title_weight=2.0):
+        self.path = path
+        self.title_weight = title_weight
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # rowid is Document.id; porter stemming so 'networks' matches 'network'
+            self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS paper_fts USING fts5("
+                               "title, abstract, tokenize='porter unicode61')")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._conn.commit()
+
+    def add(self, docs):
+        """Indexes [(doc_id, title, abstract)], replacing any existing entries for those ids."""
+        rows = [(int(doc_id), title or '', abstract or '') for doc_id, title, abstract in docs]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM paper_fts WHERE rowid = ?", [(row[0],) for row in rows])
+            self._conn.executemany("INSERT INTO paper_fts (rowid, title, abstract) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM paper_fts WHERE rowid = ?", (int(doc_id),))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM paper_fts")
+            self._conn.commit()
+
+    def search(self, query, k=5, phrase=False, allowed_ids=None):
+        """
+        Returns [(doc_id, bm25 score)], best first. Higher scores are better.
+        `allowed_ids` restricts matching to those documents.
+        """
+        expression = match_expression(query, phrase)
+        if expression is None:
+            return []
+        sql = "SELECT rowid, bm25(paper_fts, ?, 1.0) AS score FROM paper_fts WHERE paper_fts MATCH ?"
+        params = [self.title_weight, expression]
+        if allowed_ids is not None:
+            # One JSON parameter instead of one per id, which would hit SQLite's variable limit
+            sql += " AND rowid IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(sorted(int(doc_id) for doc_id in allowed_ids)))
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY score LIMIT ?", params + [k]).fetchall()
+        # FTS5's bm25() is negated so that ascending order is best first
+        return [(doc_id, -score) for doc_id, score in rows]
+
+    def stats(self):
+        """(row count, max doc id), used to check the index against the Document table."""
+        with self._lock:
+            count, max_id = self._conn.execute("SELECT COUNT(*), MAX(rowid) FROM paper_fts").fetchone()
+        return count, max_id or 0
+
+    def corpus_version(self):
+        """CorpusState version the index was last brought in line with, or None if never recorded."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'corpus_version'").fetchone()
+        return row[0] if row else None
+
+    def set_corpus_version(self, version):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('corpus_version', ?)", (int(version),))
+            self._conn.commit()
@@ -0,0 +1,72 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-item calls into batches. A background thread
+    takes the first waiting item, collects whatever else arrives within
+    `max_wait_ms` (up to `max_batch_size` items) and runs `process_batch` once
+    on the list. Each caller gets a Future for its own result.
+
+    Used for query encoding: one model.encode() call on 32 texts costs little
+    more than on one, so concurrent searches share the forward pass.
+    """
+    def __init__(self, process_batch, max_batch_size=32, max_wait_ms=2.0, name='micro-batcher'):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(item).result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                # Drain what's already queued without waiting, then wait out the window
+                batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)) if self.max_wait
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Skip callers that cancelled while queued
+            batch = [(item, future) for item, future in self._collect() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                results = self.process_batch(items)
+                for future, result in zip(futures, results):
+                    future.set_result(result)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+            self.batches += 1
+            self.items += len(items)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000
+        }
@@ -0,0 +1,26 @@
+from app import app, db
+from sqlalchemy import inspect
+from models import Entity, Concept, DocumentConcept
+from graph_store import rebuild_graph
+
+def migrate():
+    with app.app_context():
+        print("Migrating database for normalised concepts...")
+
+        # Concept tables are derived from Entity, so an old layout (keyed on text only) is simply recreated
+        columns = {col['name'] for col in inspect(db.engine).get_columns('concept')} if inspect(db.engine).has_table('concept') else set()
+        if columns and 'norm_text' not in columns:
+            DocumentConcept.__table__.drop(db.engine)
+            Concept.__table__.drop(db.engine)
+            print("Dropped old concept tables.")
+        db.create_all()
+
+        # create_all() does not add indexes to tables that already exist
+        for index in Entity.__table__.indexes | DocumentConcept.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+            print(f"Ensured index {index.name}.")
+
+        rebuild_graph()
+
+if __name__ == '__main__':
+    migrate()
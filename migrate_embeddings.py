@@ -1,5 +1,9 @@
 from app import app, db
 from sqlalchemy import text
+from embedding_codec import encode_embedding, decode_embedding, is_legacy
+from search_engine import normalize_rows
+import numpy as np
+import argparse
 
 def migrate():
     with app.app_context():
@@ -15,5 +19,58 @@ def migrate():
         except Exception as e:
             print(f"embedding column might already exist or error: {e}")
 
+def convert_embeddings(dtype='float32', batch_size=500, reencode=False, normalize=True):
+    """
+    Rewrites pickled embeddings into the raw binary format from embedding_codec,
+    one batch of rows per transaction. With `reencode`, rows already in the binary
+    format are rewritten too (e.g. to switch float32 -> float16). With `normalize`,
+    vectors not of unit length are scaled to it, as the inner-product index expects.
+    """
+    with app.app_context():
+        print(f"Converting embeddings to {dtype} blobs...")
+        converted = 0
+        last_id = 0
+        while True:
+            with db.engine.connect() as conn:
+                rows = conn.execute(
+                    text("SELECT id, embedding FROM document WHERE embedding IS NOT NULL AND id > :last_id "
+                         "ORDER BY id LIMIT :limit"),
+                    {"last_id": last_id, "limit": batch_size}
+                ).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                
+                updates = []
+                for doc_id, blob in rows:
+                    try:
+                        vector = decode_embedding(blob)
+                        unnormalized = normalize and abs(np.linalg.norm(vector) - 1.0) > 1e-3
+                        if not (reencode or unnormalized or is_legacy(blob)):
+                            continue
+                        if normalize:
+                            vector = normalize_rows(vector)[0]
+                        updates.append({"id": doc_id, "embedding": encode_embedding(vector, dtype)})
+                    except Exception as e:
+                        print(f"Skipping document {doc_id}: {e}")
+                        
+                if updates:
+                    conn.execute(text("UPDATE document SET embedding = :embedding WHERE id = :id"), updates)
+                    conn.commit()
+                    converted += len(updates)
+                print(f"Processed rows up to id {last_id} ({converted} converted).")
+                
+        print(f"Converted {converted} embeddings.")
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Add the embedding column, convert pickled embeddings to raw blobs "
+                                                 "and normalise them to unit length.")
+    parser.add_argument('--dtype', default=app.config['EMBEDDING_DTYPE'], choices=['float32', 'float16', 'int8'])
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--reencode', action='store_true', help="Also rewrite rows already in the binary format")
+    parser.add_argument('--no-normalize', dest='normalize', action='store_false',
+                        help="Keep vectors at their stored length")
+    args = parser.parse_args()
+    
     migrate()
+    convert_embeddings(dtype=args.dtype, batch_size=args.batch_size, reencode=args.reencode, normalize=args.normalize)
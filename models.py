@@ -21,17 +21,192 @@ class User(UserMixin, db.Model):
 class Document(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(300), nullable=False)
+    title_hash = db.Column(db.String(40), index=True) # Normalised title fingerprint, see dedup.title_hash
     abstract = db.Column(db.Text, nullable=False)
     source_url = db.Column(db.String(500))
-    published_date = db.Column(db.DateTime)
-    ingestion_date = db.Column(db.DateTime, default=datetime.utcnow)
-    embedding = db.Column(db.PickleType) # Stores the vector as a numpy array
+    published_date = db.Column(db.DateTime, index=True)
+    ingestion_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    embedding = db.Column(db.LargeBinary) # Raw vector bytes, see embedding_codec
     
     entities = db.relationship('Entity', backref='document', lazy='dynamic')
 
+    @property
+    def source(self):
+        """'arxiv', 'upload' or 'manual', derived from source_url (see source_filter)."""
+        url = self.source_url or ''
+        if 'arxiv.org' in url:
+            return 'arxiv'
+        if '/uploads/' in url:
+            return 'upload'
+        return 'manual'
+
+    @classmethod
+    def source_filter(cls, source):
+        """SQL condition matching the `source` property."""
+        arxiv = cls.source_url.like('%arxiv.org%')
+        upload = cls.source_url.like('%/uploads/%')
+        if source == 'arxiv':
+            return arxiv
+        if source == 'upload':
+            return db.and_(upload, db.not_(arxiv))
+        return db.or_(cls.source_url.is_(None), db.not_(db.or_(arxiv, upload)))
+
+    @classmethod
+    def get_many(cls, doc_ids, titles_only=False):
+        """
+        Fetches documents for a ranked id list in one query, preserving the
+        ranking order and skipping ids that no longer exist. The embedding blob
+        is never loaded; with `titles_only` the abstract is skipped too.
+        """
+        if not doc_ids:
+            return []
+        if titles_only:
+            options = [db.load_only(cls.id, cls.title)]
+        else:
+            options = [db.defer(cls.embedding)]
+        rows = cls.query.options(*options).filter(cls.id.in_(doc_ids)).all()
+        by_id = {doc.id: doc for doc in rows}
+        return [by_id[doc_id] for doc_id in doc_ids if doc_id in by_id]
+
 class Entity(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    text = db.Column(db.String(100), nullable=False)
-    label = db.Column(db.String(50), nullable=False)
-    doc_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False)
+    text = db.Column(db.String(100), nullable=False, index=True)
+    label = db.Column(db.String(50), nullable=False, index=True)
+    doc_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False, index=True)
+
+
+class Concept(db.Model):
+    """A deduplicated entity: one row per normalised text + label, shared by every paper mentioning it."""
+    __table_args__ = (
+        db.UniqueConstraint('norm_text', 'label', name='uq_concept_norm_text_label'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    norm_text = db.Column(db.String(100), nullable=False) # See graph_store.normalize_concept
+    text = db.Column(db.String(100), nullable=False) # First surface form seen, for display
+    label = db.Column(db.String(50), nullable=False, index=True)
+    doc_count = db.Column(db.Integer, nullable=False, default=0, index=True) # Node degree
+
+class DocumentConcept(db.Model):
+    """Doc <-> concept association; also the materialised edges of the knowledge graph."""
+    __tablename__ = 'document_concept'
+    __table_args__ = (
+        # The primary key serves doc -> concepts; this serves concept -> docs without touching the table
+        db.Index('ix_document_concept_concept_doc', 'concept_id', 'doc_id'),
+    )
+    doc_id = db.Column(db.Integer, db.ForeignKey('document.id'), primary_key=True)
+    concept_id = db.Column(db.Integer, db.ForeignKey('concept.id'), primary_key=True)
+
+class DocumentChunk(db.Model):
+    """A passage of an uploaded PDF's full text; its vector is in the search engine's chunk index under this id."""
+    __tablename__ = 'document_chunk'
+    id = db.Column(db.Integer, primary_key=True)
+    doc_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False, index=True)
+    chunk_no = db.Column(db.Integer, nullable=False) # Position in the document
+    page = db.Column(db.Integer, nullable=False) # 0-based page the chunk starts on
+    text = db.Column(db.Text, nullable=False)
+    embedding = db.Column(db.LargeBinary, nullable=False) # See embedding_codec
+
+class GraphState(db.Model):
+    """Single row whose version is bumped on every graph change; used for ETags."""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DocumentInsight(db.Model):
+    """Summary and word-frequency data computed once per abstract version."""
+    doc_id = db.Column(db.Integer, db.ForeignKey('document.id'), primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)
+    summary = db.Column(db.Text, nullable=False)
+    top_terms = db.Column(db.JSON, nullable=False) # [[word, count], ...]
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class RelatedDocument(db.Model):
+    """Materialised nearest neighbours: `related_id` is the `rank`-th most similar paper to `doc_id`."""
+    __tablename__ = 'related_document'
+    __table_args__ = (
+        db.Index('ix_related_document_doc_rank', 'doc_id', 'rank'),
+    )
+    doc_id = db.Column(db.Integer, db.ForeignKey('document.id'), primary_key=True)
+    related_id = db.Column(db.Integer, db.ForeignKey('document.id'), primary_key=True, index=True)
+    rank = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False) # Cosine similarity
+
+class Topic(db.Model):
+    """A k-means cluster of paper embeddings. New papers join the topic with the nearest centroid."""
+    id = db.Column(db.Integer, primary_key=True)
+    label = db.Column(db.String(300), nullable=False)
+    size = db.Column(db.Integer, nullable=False, default=0, index=True)
+    centroid = db.Column(db.LargeBinary, nullable=False) # Unit vector, see embedding_codec
+    top_concepts = db.Column(db.JSON, nullable=False) # [concept text, ...], most distinctive first
+    top_terms = db.Column(db.JSON, nullable=False) # [[word, count], ...] from member titles
+
+class DocumentTopic(db.Model):
+    """Topic assignment of a paper; `score` is its cosine similarity to the topic centroid."""
+    __tablename__ = 'document_topic'
+    __table_args__ = (
+        db.Index('ix_document_topic_topic_score', 'topic_id', 'score'),
+    )
+    doc_id = db.Column(db.Integer, db.ForeignKey('document.id'), primary_key=True)
+    topic_id = db.Column(db.Integer, db.ForeignKey('topic.id'), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+class TopicState(db.Model):
+    """Single row describing the last clustering run; `version` is bumped on every change for ETags."""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    clustered_docs = db.Column(db.Integer, nullable=False, default=0) # Papers in the last full run
+    assigned_since = db.Column(db.Integer, nullable=False, default=0) # Papers assigned incrementally after it
+    clustered_at = db.Column(db.DateTime)
+
+class CorpusState(db.Model):
+    """Single row whose version is bumped whenever papers are deleted; index snapshots record it."""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class ArxivCheckpoint(db.Model):
+    """Resume point of a scheduled arXiv backfill: `next_start` is the next result offset to fetch for `search_query`."""
+    __tablename__ = 'arxiv_checkpoint'
+    search_query = db.Column(db.String(300), primary_key=True)
+    next_start = db.Column(db.Integer, nullable=False, default=0)
+    total_results = db.Column(db.Integer)
+    ingested = db.Column(db.Integer, nullable=False, default=0) # New papers stored so far
+    done = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Job(db.Model):
+    LABELS = {
+        'arxiv_ingest': 'ArXiv Fetch',
+        'pdf_upload': 'PDF Upload',
+        'related_papers': 'Related Papers',
+        'topics': 'Topic Clustering'
+    }
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True) # queued, running, done, failed
+    progress = db.Column(db.Integer, default=0)
+    total = db.Column(db.Integer)
+    message = db.Column(db.String(500))
+    result = db.Column(db.JSON)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    @property
+    def label(self):
+        return self.LABELS.get(self.kind, self.kind.replace('_', ' ').title())
 
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "total": self.total,
+            "message": self.message,
+            "result": self.result,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -1,6 +1,23 @@
 import spacy
+from spacy.matcher import PhraseMatcher
+from collections import Counter
+import json
+import os
+import re
 
 nlp = None
+keyword_matcher = None
+
+# Domain terms for the rule-based labels (METHOD, TASK, METRIC, DATASET).
+# JSON ({"LABEL": [terms]}) or TSV (LABEL<tab>term per line).
+VOCABULARY_PATH = os.environ.get('ENTITY_VOCABULARY_PATH') or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'entity_vocabulary.json')
+
+# Entity extraction only needs the tokenizer, tok2vec and ner; skip everything else
+NER_PIPES = ('tok2vec', 'ner')
+
+# Below this many texts per process, worker start-up costs more than it saves
+MIN_TEXTS_PER_PROCESS = 200
 
 def load_model():
     global nlp
@@ -16,14 +33,73 @@ def load_model():
     if nlp is None:
         raise RuntimeError("Failed to load spaCy model 'en_core_web_sm'.")
 
+def load_vocabulary(path=VOCABULARY_PATH):
+    """Reads a vocabulary file into {label: [terms]}."""
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    vocabulary = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            label, term = line.split('\t', 1)
+            vocabulary.setdefault(label.strip(), []).append(term.strip())
+    return vocabulary
+
+def build_keyword_matcher(vocabulary=None):
+    """
+    Compiles the vocabulary into a case-insensitive PhraseMatcher once.
+    Matching then costs one pass over the tokens regardless of vocabulary size.
+    """
+    global keyword_matcher
+    load_model()
+    if vocabulary is None:
+        vocabulary = load_vocabulary()
+    matcher = PhraseMatcher(nlp.vocab, attr='LOWER')
+    for label, terms in vocabulary.items():
+        # make_doc only tokenizes, which is all a LOWER matcher needs
+        matcher.add(label, [nlp.make_doc(term) for term in terms])
+    keyword_matcher = matcher
+    return matcher
+
+def find_keywords(doc):
+    """Returns every vocabulary match in a parsed doc as (text, label, start_char, end_char)."""
+    if keyword_matcher is None:
+        build_keyword_matcher()
+    return [
+        (span.text, nlp.vocab.strings[match_id], span.start_char, span.end_char)
+        for match_id, start, end in keyword_matcher(doc)
+        for span in [doc[start:end]]
+    ]
+
 def extract_entities(text):
     """
     Extracts entities from text using spaCy and simple rules.
     Returns a list of tuples: (text, label)
     """
     load_model()
-    doc = nlp(text)
-    
+    return _collect_entities(nlp(text, disable=_unused_pipes()))
+
+def extract_entities_batch(texts, n_process=1, batch_size=64):
+    """
+    Batched version of extract_entities built on nlp.pipe, with the parser,
+    tagger and lemmatizer disabled. `n_process` > 1 spreads large batches over
+    worker processes. Returns one list of (text, label) tuples per input text, in order.
+    """
+    load_model()
+    texts = list(texts)
+    if n_process != 1 and len(texts) < MIN_TEXTS_PER_PROCESS * max(n_process, 2):
+        n_process = 1
+    docs = nlp.pipe(texts, batch_size=batch_size, n_process=n_process, disable=_unused_pipes())
+    return [_collect_entities(doc) for doc in docs]
+
+def _unused_pipes():
+    return [name for name in nlp.pipe_names if name not in NER_PIPES]
+
+def _collect_entities(doc):
+    """Combines spaCy entities from a parsed doc with the keyword rules."""
     entities = []
     
     # 1. Standard spaCy entities
@@ -31,24 +107,13 @@ def extract_entities(text):
         if ent.label_ in ['ORG', 'PERSON', 'GPE', 'DATE', 'EVENT']:
             entities.append((ent.text, ent.label_))
             
-    # 2. Custom Rule-based extraction (Simulation for now)
-    # In a real scenario, we would train a custom NER model.
-    keywords = {
-        'METHOD': ['Neural Network', 'Deep Learning', 'Transformer', 'CNN', 'RNN', 'LSTM', 'SVM', 'Algorithm'],
-        'TASK': ['Classification', 'Regression', 'Segmentation', 'Detection'],
-        'METRIC': ['Accuracy', 'F1 Score', 'Precision', 'Recall'],
-        'DATASET': ['ImageNet', 'COCO', 'MNIST', 'CIFAR']
-    }
-    
-    lower_text = text.lower()
-    for label, terms in keywords.items():
-        for term in terms:
-            if term.lower() in lower_text:
-                # Find the actual case in text if possible, or just use title case
-                start = lower_text.find(term.lower())
-                if start != -1:
-                    original_text = text[start:start+len(term)]
-                    entities.append((original_text, label))
+    # 2. Vocabulary matches (all occurrences, on token boundaries).
+    # Record the first surface form of each term so case variants don't duplicate it.
+    seen_terms = set()
+    for term_text, label, _, _ in find_keywords(doc):
+        if term_text.lower() not in seen_terms:
+            seen_terms.add(term_text.lower())
+            entities.append((term_text, label))
                     
     # Deduplicate based on text
     unique_entities = {}
@@ -58,6 +123,16 @@ def extract_entities(text):
             
     return list(unique_entities.items())
 
+# Words too common in abstracts to be interesting in the word-frequency chart
+CHART_STOPWORDS = frozenset(['the', 'and', 'of', 'to', 'in', 'a', 'is', 'for', 'that', 'on', 'with', 'as', 'are', 'by', 'it', 'an', 'be', 'this', 'from', 'at', 'which', 'or', 'not', 'but', 'can', 'has', 'have', 'we', 'our', 'their', 'all', 'more', 'one', 'new', 'used', 'using', 'also', 'paper', 'results', 'data', 'model', 'based', 'such', 'these'])
+WORD_PATTERN = re.compile(r'\w+')
+
+def top_terms(text, n=10):
+    """Most frequent non-stopword terms as a list of [word, count] pairs."""
+    words = WORD_PATTERN.findall(text.lower())
+    filtered_words = [w for w in words if w not in CHART_STOPWORDS and len(w) > 2 and not w.isdigit()]
+    return [[word, count] for word, count in Counter(filtered_words).most_common(n)]
+
 def generate_summary(text, num_sentences=3):
     """
     Generates a simple extractive summary by scoring sentences based on word frequency.
@@ -0,0 +1,147 @@
+"""
+PDF full-text ingestion. Pages are extracted by a process pool and streamed
+in order into overlapping chunks, which are embedded in batches and stored
+as DocumentChunk rows plus vectors in the search engine's chunk index. Only
+a few page ranges and one batch of chunks are held in memory at a time.
+"""
+import multiprocessing
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+WHITESPACE = re.compile(r'\s+')
+
+def _extract_range(file_path, start, stop):
+    """Worker: text of pages [start, stop). Each process opens its own reader."""
+    import pypdf
+    reader = pypdf.PdfReader(file_path)
+    texts = []
+    for page in reader.pages[start:stop]:
+        try:
+            texts.append(page.extract_text() or "")
+        except Exception as e:
+            print(f"Could not extract a page of {file_path}: {e}")
+            texts.append("")
+    return texts
+
+def page_count(file_path):
+    import pypdf
+    return len(pypdf.PdfReader(file_path).pages)
+
+def stream_pages(file_path, processes=2, pages_per_task=8, total=None):
+    """
+    Yields (page_number, text) in page order while a process pool extracts
+    ahead. At most 2 * processes page ranges are in flight, so memory stays
+    bounded however long the PDF is.
+    """
+    if total is None:
+        total = page_count(file_path)
+    ranges = deque((start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task))
+    if processes <= 1:
+        for start, stop in ranges:
+            for offset, text in enumerate(_extract_range(file_path, start, stop)):
+                yield start + offset, text
+        return
+
+    # 'spawn' so the pool never forks the web worker's threads and open sockets
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        pending = deque()
+        while ranges or pending:
+            while ranges and len(pending) < 2 * processes:
+                start, stop = ranges.popleft()
+                pending.append((start, pool.submit(_extract_range, file_path, start, stop)))
+            start, future = pending.popleft()
+            for offset, text in enumerate(future.result()):
+                yield start + offset, text
+
+def chunk_pages(pages, chunk_chars=1000, overlap=200):
+    """
+    Splits a stream of (page_number, text) into overlapping chunks of about
+    `chunk_chars` characters, cut at word boundaries. Yields
+    (page_number, text), tagged with the page the chunk starts on. Only the
+    current chunk is buffered.
+    """
+    step = max(chunk_chars - overlap, 1)
+    buffer = ""
+    buffer_page = 0
+    for page_number, text in pages:
+        text = WHITESPACE.sub(' ', text).strip()
+        if not text:
+            continue
+        if not buffer:
+            buffer_page = page_number
+        buffer = f"{buffer} {text}" if buffer else text
+        while len(buffer) >= chunk_chars:
+            cut = buffer.rfind(' ', step, chunk_chars)
+            cut = cut if cut > 0 else chunk_chars
+            yield buffer_page, buffer[:cut].strip()
+            # Keep `overlap` characters of context, starting at a word boundary
+            tail = buffer.find(' ', max(cut - overlap, 0))
+            buffer = buffer[tail + 1 if 0 <= tail < cut else cut:].strip()
+            buffer_page = page_number
+    if buffer:
+        yield buffer_page, buffer
+
+def _chunk_batches(chunks, batch_size):
+    chunks = iter(chunks)
+    while True:
+        batch = list(islice(chunks, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def index_chunks(engine, doc_id, chunks, embedding_dtype='float32', batch_size=64, on_batch=None):
+    """
+    Embeds `chunks` ((page_number, text) pairs) batch by batch, stores them as
+    DocumentChunk rows and adds their vectors to the engine's chunk index.
+    Each batch is committed, then reported as on_batch(chunks so far, pages
+    reached). Returns the number of chunks indexed.
+    """
+    from database import db
+    from models import DocumentChunk
+    from embedding_codec import encode_embedding
+    count = 0
+    for batch in _chunk_batches(chunks, batch_size):
+        embeddings = engine.bulk_encode([text for _, text in batch])
+        rows = [DocumentChunk(doc_id=doc_id, chunk_no=count + i, page=page, text=text,
+                              embedding=encode_embedding(embedding, embedding_dtype))
+                for i, ((page, text), embedding) in enumerate(zip(batch, embeddings))]
+        db.session.add_all(rows)
+        db.session.flush()
+        chunk_ids = [row.id for row in rows]
+        db.session.commit()
+        engine.add_chunks(doc_id, chunk_ids, embeddings)
+        count += len(rows)
+        if on_batch:
+            on_batch(count, batch[-1][0] + 1)
+    return count
+
+def load_chunk_index(engine, after_id=0, batch_size=5000):
+    """
+    Adds stored chunk embeddings with ids above `after_id` (the snapshot's
+    watermark) to the engine's chunk index, keyset-paged by id.
+    """
+    from database import db
+    from models import DocumentChunk
+    from embedding_codec import decode_embedding
+    last_id = after_id
+    loaded = 0
+    while True:
+        rows = db.session.query(DocumentChunk.id, DocumentChunk.doc_id, DocumentChunk.embedding) \
+            .filter(DocumentChunk.id > last_id).order_by(DocumentChunk.id).limit(batch_size).all()
+        if not rows:
+            break
+        by_doc = {}
+        for chunk_id, doc_id, blob in rows:
+            ids, vectors = by_doc.setdefault(doc_id, ([], []))
+            ids.append(chunk_id)
+            vectors.append(decode_embedding(blob))
+        for doc_id, (ids, vectors) in by_doc.items():
+            engine.add_chunks(doc_id, ids, vectors)
+        last_id = rows[-1][0]
+        loaded += len(rows)
+    if loaded:
+        print(f"Loaded {loaded} full-text chunks into the chunk index.")
+    return loaded
@@ -0,0 +1,140 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from embedding_codec import encode_embedding, decode_embedding
+
+def normalize_query(query):
+    """Case- and whitespace-insensitive cache key, so 'Deep  Learning' and 'deep learning' share an entry."""
+    return re.sub(r'\s+', ' ', query).strip().lower()
+
+class SharedQueryStore:
+    """
+    SQLite-backed second-level cache. Every gunicorn worker opens the same file,
+    so a query encoded by one worker is a hit for all the others.
+    """
+    def __init__(self, path, namespace='', max_rows=50000):
+        self.path = path
+        self.namespace = namespace # Model name, so different encoders never share vectors
+        self.max_rows = max_rows
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=1, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS query_embedding (key TEXT PRIMARY KEY, embedding BLOB NOT NULL)")
+            self._conn.commit()
+        
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT embedding FROM query_embedding WHERE key = ?",
+                                     (f"{self.namespace}:{key}",)).fetchone()
+        return decode_embedding(row[0]) if row else None
+    
+    def set(self, key, vector):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO query_embedding (key, embedding) VALUES (?, ?)",
+                               (f"{self.namespace}:{key}", encode_embedding(vector)))
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                # Keep only the most recently written rows
+                self._conn.execute("DELETE FROM query_embedding WHERE rowid <= (SELECT MAX(rowid) FROM query_embedding) - ?",
+                                   (self.max_rows,))
+            self._conn.commit()
+
+class QueryEmbeddingCache:
+    """Bounded LRU cache of query embeddings, optionally backed by a SharedQueryStore."""
+    def __init__(self, maxsize=1024, shared_store=None):
+        self.maxsize = maxsize
+        self.shared_store = shared_store
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        
+    def get_or_compute(self, query, compute):
+        """Returns the cached embedding for `query`, calling compute(query) on a miss."""
+        key = normalize_query(query)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+                
+        vector = None
+        if self.shared_store is not None:
+            try:
+                vector = self.shared_store.get(key)
+            except sqlite3.Error as e:
+                print(f"Shared query cache read failed: {e}")
+                
+        with self._lock:
+            if vector is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                
+        if vector is None:
+            # MiniLM is uncased, so encoding the normalised key loses nothing
+            vector = compute(key)
+            if self.shared_store is not None:
+                try:
+                    self.shared_store.set(key, vector)
+                except sqlite3.Error as e:
+                    print(f"Shared query cache write failed: {e}")
+                    
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return vector
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "shared": self.shared_store is not None
+        }
+
+class RankedResultCache:
+    """
+    Short-lived cache of full ranked result lists, so paging through a search
+    runs the deep top-k once and serves every later page by slicing.
+    """
+    def __init__(self, ttl=300, maxsize=256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        
+    def get_or_compute(self, key, compute):
+        """Returns the cached [(doc_id, score)] list for `key`, calling compute() if missing or expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+                
+        results = compute()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return results
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
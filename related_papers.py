@@ -0,0 +1,109 @@
+from sqlalchemy import delete, insert
+from database import db
+from models import Document, RelatedDocument
+
+RELATED_K = 10 # Neighbours stored per paper; pages show fewer, so deletions leave spares
+REVERSE_FACTOR = 4 # A new paper is offered to this many times k of its own neighbours
+
+def is_materialised():
+    return db.session.query(RelatedDocument.doc_id).first() is not None
+
+def related_documents(doc_id, limit=5):
+    """The stored most-similar papers for `doc_id`, best first: one read of the (doc_id, rank) index."""
+    return Document.query.join(RelatedDocument, RelatedDocument.related_id == Document.id) \
+        .options(db.defer(Document.embedding)) \
+        .filter(RelatedDocument.doc_id == doc_id) \
+        .order_by(RelatedDocument.rank).limit(limit).all()
+
+def _write(neighbours):
+    """Replaces the stored lists for the docs in `neighbours` ({doc_id: [(related_id, score)]})."""
+    if not neighbours:
+        return
+    table = RelatedDocument.__table__
+    doc_ids = list(neighbours)
+    for i in range(0, len(doc_ids), 500):
+        db.session.execute(delete(table).where(table.c.doc_id.in_(doc_ids[i:i + 500])))
+    rows = [{"doc_id": doc_id, "related_id": related_id, "rank": rank, "score": score}
+            for doc_id, related in neighbours.items()
+            for rank, (related_id, score) in enumerate(related)]
+    if rows:
+        db.session.execute(insert(table), rows)
+
+def materialise(engine, k=RELATED_K, batch_size=1024, progress=None):
+    """
+    Recomputes every paper's top-k neighbours with batched all-pairs searches:
+    each batch reconstructs `batch_size` vectors and sends them to FAISS as a
+    single query matrix. Lists are replaced batch by batch and committed, so
+    pages keep showing the old neighbours until their batch is done.
+    """
+    doc_ids = engine.doc_ids()
+    print(f"Materialising related papers for {len(doc_ids)} documents...")
+    for start in range(0, len(doc_ids), batch_size):
+        _write(engine.find_similar_many(doc_ids[start:start + batch_size], k))
+        db.session.commit()
+        done = min(start + batch_size, len(doc_ids))
+        if progress:
+            progress(done, total=len(doc_ids))
+            
+    # Lists of papers no longer in the index
+    table = RelatedDocument.__table__
+    db.session.execute(delete(table).where(table.c.doc_id.not_in(db.select(Document.id))))
+    db.session.commit()
+    print(f"Stored neighbours for {len(doc_ids)} documents.")
+    return len(doc_ids)
+
+def _stored(doc_ids):
+    stored = {doc_id: [] for doc_id in doc_ids}
+    for doc_id, related_id, score in db.session.query(RelatedDocument.doc_id, RelatedDocument.related_id,
+                                                      RelatedDocument.score) \
+            .filter(RelatedDocument.doc_id.in_(list(doc_ids))).order_by(RelatedDocument.rank):
+        stored[doc_id].append((related_id, score))
+    return stored
+
+def add_documents(engine, doc_ids, k=RELATED_K):
+    """
+    Stores neighbours for newly indexed papers and slots them into the lists
+    of existing papers they now rank in. Cosine similarity is symmetric, so
+    the papers whose lists can change are found by searching around each new
+    paper, widened to REVERSE_FACTOR * k. Runs in the caller's transaction.
+    """
+    if not doc_ids or not is_materialised():
+        return
+    new_ids = set(doc_ids)
+    candidates = engine.find_similar_many(doc_ids, k * REVERSE_FACTOR)
+    updates = {doc_id: related[:k] for doc_id, related in candidates.items()}
+
+    offers = {}
+    for new_id, related in candidates.items():
+        for related_id, score in related:
+            if related_id not in new_ids:
+                offers.setdefault(related_id, []).append((new_id, score))
+    for doc_id, related in _stored(offers).items():
+        best = dict(related)
+        best.update(offers[doc_id])
+        merged = sorted(best.items(), key=lambda item: item[1], reverse=True)[:k]
+        if merged != related:
+            updates[doc_id] = merged
+    _write(updates)
+
+def remove_document(doc_id):
+    """
+    Deletes a paper's rows in both directions before the paper itself is
+    deleted. Returns the ids whose lists lost an entry; pass them to refresh()
+    once the vector is out of the index.
+    """
+    table = RelatedDocument.__table__
+    affected = [did for (did,) in db.session.query(RelatedDocument.doc_id).filter(RelatedDocument.related_id == doc_id)]
+    db.session.execute(delete(table).where(table.c.related_id == doc_id))
+    db.session.execute(delete(table).where(table.c.doc_id == doc_id))
+    return affected
+
+def refresh(engine, doc_ids, k=RELATED_K):
+    """Recomputes the stored lists of `doc_ids`. Runs in the caller's transaction."""
+    if doc_ids:
+        _write(engine.find_similar_many(doc_ids, k))
+
+if __name__ == '__main__':
+    from app import app, get_search_engine
+    with app.app_context():
+        materialise(get_search_engine())
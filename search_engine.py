@@ -1,82 +1,534 @@
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
-import pickle
+from encoders import create_encoder
+from embedding_codec import encode_embedding, decode_into
+from query_cache import QueryEmbeddingCache
+from micro_batcher import MicroBatcher
+from lexical_index import is_keyword_query, reciprocal_rank_fusion
+import json
+import os
+import threading
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+# Allow-lists up to this size are ranked exactly from reconstructed vectors
+EXACT_FILTER_LIMIT = 4096
+
+def normalize_rows(vectors):
+    """Scales vectors to unit length (float32 copy), so inner product equals cosine similarity."""
+    vectors = np.array(vectors, dtype='float32', ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def trained_nlist(index_type, n, nlist=100):
+    """
+    Number of IVF lists create_index trains for `n` vectors, or 0 when the
+    type needs no training or `n` is too few to train it (a flat fallback).
+    """
+    if index_type not in ('ivf_flat', 'ivf_pq'):
+        return 0
+    # FAISS wants ~39 training points per list; PQ needs 256 per sub-quantizer
+    if index_type == 'ivf_pq' and n < 256:
+        return 0
+    return max(min(nlist, n // 39), 0)
+
+def describe_index(index):
+    """(index type, nlist) of a built index; nlist is None unless it is IVF."""
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexIVFPQ):
+        return 'ivf_pq', int(base.nlist)
+    if isinstance(base, faiss.IndexIVFFlat):
+        return 'ivf_flat', int(base.nlist)
+    if isinstance(base, faiss.IndexHNSW):
+        return 'hnsw', None
+    return 'flat', None
+
+def create_index(index_type, dimension, vectors, nlist=100, pq_m=48, hnsw_m=32):
+    """
+    Creates an empty inner-product FAISS index of the given type, trained on
+    `vectors` if the type needs training. Falls back to a flat index while the
+    corpus is too small to train the quantizers. Vectors must be normalised,
+    so scores are cosine similarities.
+    
+    Vectors are always added with add_with_ids() keyed by Document.id: flat and
+    HNSW indexes are wrapped in IndexIDMap2, IVF indexes store the ids natively.
+    """
+    n = len(vectors)
+    if index_type == 'hnsw':
+        return faiss.IndexIDMap2(faiss.IndexHNSWFlat(dimension, hnsw_m, faiss.METRIC_INNER_PRODUCT))
+    if index_type in ('ivf_flat', 'ivf_pq'):
+        nlist = trained_nlist(index_type, n, nlist)
+        if nlist < 1:
+            print(f"Only {n} vectors, too few to train '{index_type}'. Using a flat index.")
+            return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        quantizer = faiss.IndexFlatIP(dimension)
+        if index_type == 'ivf_flat':
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, 8, faiss.METRIC_INNER_PRODUCT)
+        print(f"Training {index_type} index ({nlist} lists) on {n} vectors...")
+        index.train(vectors)
+        # Hashtable direct map lets reconstruct() and remove_ids() work with arbitrary ids
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+
+def _base_index(index):
+    """Returns the index wrapped by an IndexIDMap2, or the index itself."""
+    if isinstance(index, faiss.IndexIDMap2):
+        return faiss.downcast_index(index.index)
+    return index
+
+def apply_search_params(index, nprobe=8, ef_search=64):
+    """Sets nprobe (IVF) or efSearch (HNSW) on an index; a no-op for flat indexes."""
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        base.nprobe = nprobe
+    elif isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = ef_search
+
+def filtered_search_params(index, selector, selectivity, nprobe=8, ef_search=64):
+    """
+    SearchParameters that restrict a search to `selector`. With only a fraction
+    `selectivity` of the vectors eligible, IVF probes and the HNSW beam widen
+    proportionally so the top-k is still filled from eligible vectors.
+    """
+    base = _base_index(index)
+    scale = 1.0 / max(selectivity, 1e-6)
+    if isinstance(base, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=min(base.nlist, int(np.ceil(nprobe * scale))))
+    if isinstance(base, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=min(1024, int(np.ceil(ef_search * scale))))
+    return faiss.SearchParameters(sel=selector)
+
+def supports_removal(index):
+    """HNSW graphs cannot drop vectors; every other index type can."""
+    return not isinstance(_base_index(index), faiss.IndexHNSW)
+
+class ChunkIndex:
+    """
+    Vectors of full-text passages (DocumentChunk ids), each mapped back to its
+    Document.id. Searches score every paper by its best-matching passage.
+    Always exact: chunks are only added for uploaded PDFs.
+    """
+    def __init__(self, dimension):
+        self.dimension = dimension
+        self.clear()
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    def clear(self):
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+        self.doc_of = {} # chunk id -> doc id
+        self.chunks_of = {} # doc id -> [chunk ids]
+
+    def restore(self, index, chunk_ids, doc_ids):
+        """Swaps in an index read from a snapshot, with its parallel chunk id and doc id lists."""
+        self.index = index
+        self.doc_of = dict(zip(chunk_ids, doc_ids))
+        self.chunks_of = {}
+        for chunk_id, doc_id in self.doc_of.items():
+            self.chunks_of.setdefault(doc_id, []).append(chunk_id)
+
+    def add(self, doc_id, chunk_ids, vectors):
+        self.index.add_with_ids(vectors, np.asarray(chunk_ids, dtype='int64'))
+        for chunk_id in chunk_ids:
+            self.doc_of[int(chunk_id)] = doc_id
+        self.chunks_of.setdefault(doc_id, []).extend(int(chunk_id) for chunk_id in chunk_ids)
+
+    def remove(self, doc_id):
+        chunk_ids = self.chunks_of.pop(doc_id, [])
+        if chunk_ids:
+            self.index.remove_ids(np.array(chunk_ids, dtype='int64'))
+            for chunk_id in chunk_ids:
+                del self.doc_of[chunk_id]
+        return bool(chunk_ids)
+
+    def search(self, query_vectors, k, allowed_ids=None, fanout=8):
+        """
+        Per query, [(doc_id, best passage similarity)] for up to k papers, best
+        first. Fetches k * fanout passages since one paper can fill many slots.
+        """
+        params = None
+        if allowed_ids is not None:
+            chunk_ids = [chunk_id for doc_id in allowed_ids for chunk_id in self.chunks_of.get(doc_id, ())]
+            if not chunk_ids:
+                return [[] for _ in range(len(query_vectors))]
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.array(chunk_ids, dtype='int64')))
+        scores, indices = self.index.search(query_vectors, min(k * fanout, max(self.index.ntotal, 1)), params=params)
+        results = []
+        for row_scores, row_ids in zip(scores, indices):
+            best = {}
+            for score, chunk_id in zip(row_scores, row_ids):
+                doc_id = self.doc_of.get(int(chunk_id))
+                if doc_id is not None and doc_id not in best:
+                    best[doc_id] = float(score) # Rows are sorted, so the first passage is the best
+                    if len(best) == k:
+                        break
+            results.append(list(best.items()))
+        return results
 
 class SearchEngine:
-    def __init__(self, model_name='all-MiniLM-L6-v2'):
+    def __init__(self, model_name='all-MiniLM-L6-v2', index_type='flat', nlist=100, pq_m=48,
+                 nprobe=8, hnsw_m=32, ef_search=64, embedding_dtype='float32', query_cache=None,
+                 lexical_index=None, rrf_k=60, min_similarity=0.0, encode_batch_size=32, encode_max_wait_ms=None,
+                 encoder_backend='torch', model_dir=None):
         print("Loading Search Engine Model...")
-        self.model = SentenceTransformer(model_name)
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+        self.model_name = model_name
+        self.encoder_backend = encoder_backend
+        self.model = create_encoder(encoder_backend, model_name, model_dir)
         self.dimension = 384 # Dimension for MiniLM-L6-v2
-        self.index = faiss.IndexFlatL2(self.dimension)
-        self.documents = [] # Keep track of document IDs corresponding to index
+        self.index_type = index_type
+        self.nlist = nlist
+        self.pq_m = pq_m
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.embedding_dtype = embedding_dtype # Storage format for Document.embedding
+        self.query_cache = query_cache if query_cache is not None else QueryEmbeddingCache()
+        self.lexical = lexical_index # Optional LexicalIndex for keyword and hybrid search
+        self.rrf_k = rrf_k
+        self.min_similarity = min_similarity # search() drops matches below this cosine similarity
+        # Concurrent encode() calls share one model.encode() batch; None encodes each call directly
+        self.encoder = None
+        if encode_max_wait_ms is not None:
+            self.encoder = MicroBatcher(self.bulk_encode, max_batch_size=encode_batch_size,
+                                        max_wait_ms=encode_max_wait_ms, name='query-encoder')
+        self.index = create_index('flat', self.dimension, [])
+        self.documents = set() # Document IDs currently live in the index
+        # HNSW graphs keep every vector they were given, so there a doc's live vector is tracked by its
+        # internal position, and replaced or removed vectors are hidden by position
+        self.positions = {} # doc id -> position of its live vector (HNSW only)
+        self.tombstones = set() # Positions of vectors an HNSW index still holds but no longer serves
+        self.chunks = ChunkIndex(self.dimension) # Full-text passages of uploaded PDFs
+        # Held around every index read and write: background jobs add to the index while requests search
+        # it. Re-entrant because searches call each other; encoding happens outside it.
+        self.lock = threading.RLock()
+        
+    def _build_index(self, vectors):
+        return create_index(self.index_type, self.dimension, vectors,
+                            nlist=self.nlist, pq_m=self.pq_m, hnsw_m=self.hnsw_m)
+        
+    def outgrown(self, n):
+        """
+        True when the index was trained for a much smaller corpus than `n`
+        papers: it is the flat fallback of an IVF type that `n` can now train,
+        or an IVF index with under half the lists `n` would get. IVF indexes
+        are never retrained in place, so callers rebuild.
+        """
+        built, nlist = describe_index(self.index)
+        target = trained_nlist(self.index_type, n, self.nlist)
+        if built == 'flat':
+            return target > 0
+        return nlist is not None and target >= 2 * nlist
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """Applies query-time recall/latency knobs to the current index."""
+        with self.lock:
+            if nprobe is not None:
+                self.nprobe = nprobe
+            if ef_search is not None:
+                self.ef_search = ef_search
+            apply_search_params(self.index, nprobe=self.nprobe, ef_search=self.ef_search)
         
     def encode(self, text):
-        return self.model.encode([text])[0]
+        if self.encoder is not None:
+            return self.encoder(text)
+        return self.bulk_encode([text])[0]
     
     def bulk_encode(self, texts):
-        return self.model.encode(texts)
+        """Unit-length embeddings, ready for the inner-product index and for storage."""
+        return normalize_rows(self.model.encode(texts))
+    
+    def encode_query(self, query):
+        """Like encode(), but repeated queries are served from the LRU cache."""
+        return self.query_cache.get_or_compute(query, self.encode)
     
-    def add_document(self, doc_id, text, embedding=None):
+    def add_documents(self, doc_ids, embeddings, texts=None):
+        """
+        Adds a batch of precomputed embeddings in a single FAISS call.
+        IDs that are already indexed are replaced. `texts`, a list of
+        (title, abstract) pairs, also updates the lexical index.
+        """
+        if len(doc_ids) == 0:
+            return
+        ids = np.asarray(doc_ids, dtype='int64')
+        # Stored rows predating normalisation would otherwise skew inner-product scores
+        vectors = normalize_rows(np.asarray(embeddings, dtype='float32').reshape(len(ids), self.dimension))
+        
+        with self.lock:
+            existing = [doc_id for doc_id in doc_ids if doc_id in self.documents]
+            for doc_id in existing:
+                self._remove_vector(doc_id)
+                
+            start = self.index.ntotal
+            self.index.add_with_ids(vectors, ids)
+            self.documents.update(int(doc_id) for doc_id in ids)
+            if not supports_removal(self.index):
+                self.positions.update((int(doc_id), start + i) for i, doc_id in enumerate(ids))
+        
+        if self.lexical is not None and texts is not None:
+            self.lexical.add((doc_id, title, abstract) for doc_id, (title, abstract) in zip(doc_ids, texts))
+        
+    def add_chunks(self, doc_id, chunk_ids, embeddings):
+        """Adds full-text passage vectors of a document, keyed by DocumentChunk.id."""
+        if len(chunk_ids) == 0:
+            return
+        vectors = normalize_rows(embeddings).reshape(len(chunk_ids), self.dimension)
+        with self.lock:
+            self.chunks.add(doc_id, chunk_ids, vectors)
+        
+    def add_document(self, doc_id, text, embedding=None, title=None):
         if embedding is None:
             embedding = self.encode(text)
             
-        # Add to FAISS index
-        # FAISS expects float32 numpy array
-        vector = np.array([embedding]).astype('float32')
-        self.index.add(vector)
-        self.documents.append(doc_id)
-        
+        self.add_documents([doc_id], [embedding], texts=[(title, text)])
         return embedding
         
-    def search(self, query, k=5):
-        query_vector = self.encode(query)
-        query_vector = np.array([query_vector]).astype('float32')
+    def update_document(self, doc_id, text, embedding=None, title=None):
+        """Re-indexes a document whose text changed. Returns the new embedding."""
+        return self.add_document(doc_id, text, embedding, title)
+        
+    def doc_ids(self):
+        """Ids of every document in the index, ascending."""
+        with self.lock:
+            return sorted(self.documents)
+        
+    def remove_document(self, doc_id):
+        """Drops a document from the vector, passage and lexical indexes so it no longer appears in results."""
+        if self.lexical is not None:
+            self.lexical.remove(doc_id)
+        with self.lock:
+            self.chunks.remove(doc_id)
+            return self._remove_vector(doc_id)
         
-        distances, indices = self.index.search(query_vector, k)
+    def _remove_vector(self, doc_id):
+        if doc_id not in self.documents:
+            return False
+        if supports_removal(self.index):
+            self.index.remove_ids(np.array([doc_id], dtype='int64'))
+        else:
+            # HNSW cannot delete; hide the vector until the next rebuild
+            self.tombstones.add(self.positions.pop(doc_id))
+        self.documents.discard(doc_id)
+        return True
         
+    def _collect_results(self, scores, ids, k, exclude=None, min_score=None):
+        """
+        Turns a FAISS result row into [(doc_id, similarity)], skipping removed
+        and duplicate IDs. Rows are sorted best first, so collection stops at
+        the first score below `min_score`.
+        """
         results = []
-        for i in range(len(indices[0])):
-            idx = indices[0][i]
-            if idx != -1 and idx < len(self.documents):
-                doc_id = self.documents[idx]
-                results.append((doc_id, float(distances[0][i])))
-                
+        seen = set()
+        for score, doc_id in zip(scores, ids):
+            doc_id = int(doc_id)
+            if min_score is not None and score < min_score:
+                break
+            if doc_id == -1 or doc_id == exclude or doc_id in seen or doc_id not in self.documents:
+                continue
+            seen.add(doc_id)
+            results.append((doc_id, float(score)))
+            if len(results) == k:
+                break
         return results
-
-    def find_similar(self, doc_id, k=5):
-        """Find papers similar to the given doc_id."""
-        if doc_id not in self.documents:
-            return []
-            
-        # Find index of doc_id in our list
-        idx = self.documents.index(doc_id)
         
-        # Reconstruct vector (FAISS IndexFlatL2 doesn't support get_vector easily unless using reconstruct if mapped)
-        # But we stored it in DB. Let's assume we can re-encode or we should have kept vectors in memory.
-        # Issue: efficient search needs vector. 
-        # Hack for now: use the index's reconstruct() if available or just re-encode abstract?
-        # Better: We have the vector in the FAISS index. IndexFlatL2 supports `reconstruct(i)`.
+    def _search_k(self, k):
+        return min(k, max(self.index.ntotal, 1))
         
-        try:
-            vector = self.index.reconstruct(idx)
-            vector = np.array([vector]).astype('float32')
+    def _index_search(self, vectors, k, allowed=None):
+        """
+        self.index.search() that never returns a tombstoned HNSW vector. HNSW is
+        searched by internal position with tombstones excluded and positions
+        mapped back to doc ids; a re-added doc's old vector carries the same id,
+        so filtering by id afterwards couldn't tell it apart. `allowed`, an int64
+        array of live doc ids, restricts the search to those documents.
+        """
+        if supports_removal(self.index) or not (self.tombstones or allowed is not None):
+            params = None
+            if allowed is not None:
+                params = filtered_search_params(self.index, faiss.IDSelectorBatch(allowed), len(allowed) / self.index.ntotal,
+                                                nprobe=self.nprobe, ef_search=self.ef_search)
+            return self.index.search(vectors, k, params=params)
             
-            # Search k+1 because the doc itself will be the top result (distance 0)
-            distances, indices = self.index.search(vector, k+1)
+        base = _base_index(self.index)
+        if allowed is not None:
+            selector = faiss.IDSelectorBatch(np.array([self.positions[doc_id] for doc_id in allowed], dtype='int64'))
+            selectivity = len(allowed) / self.index.ntotal
+        else:
+            hidden = faiss.IDSelectorBatch(np.array(sorted(self.tombstones), dtype='int64'))
+            selector = faiss.IDSelectorNot(hidden)
+            selectivity = 1.0 - len(self.tombstones) / self.index.ntotal
+        params = filtered_search_params(base, selector, selectivity, nprobe=self.nprobe, ef_search=self.ef_search)
+        scores, labels = base.search(vectors, k, params=params)
+        ids = faiss.rev_swig_ptr(self.index.id_map.data(), self.index.id_map.size())
+        return scores, np.where(labels >= 0, ids[np.maximum(labels, 0)], -1)
+        
+    def search(self, query, k=5, allowed_ids=None, min_similarity=None):
+        """
+        Nearest documents to `query` as [(doc_id, cosine similarity)], best
+        first, each scored by its abstract or best full-text passage. Matches
+        below `min_similarity` (default: the engine's cutoff) are dropped.
+        `allowed_ids` restricts the search itself to those documents, so
+        filtered searches still return k results when k eligible documents exist.
+        """
+        if min_similarity is None:
+            min_similarity = self.min_similarity
+        # Cached vectors may predate normalisation
+        query_vector = normalize_rows(self.encode_query(query))
+        
+        with self.lock:
+            if allowed_ids is not None:
+                results = self._filtered_search(query_vector, k, allowed_ids, min_similarity)
+            else:
+                scores, indices = self._index_search(query_vector, self._search_k(k))
+                results = self._collect_results(scores[0], indices[0], k, min_score=min_similarity)
+            return self._with_passages(query_vector, [results], k, min_similarity, allowed_ids)[0]
+        
+    def search_many(self, queries, k=5, min_similarity=None):
+        """Batched search(): all queries go through FAISS in one call. Returns one result list per query."""
+        if not queries:
+            return []
+        if min_similarity is None:
+            min_similarity = self.min_similarity
+        query_vectors = normalize_rows([self.encode_query(query) for query in queries])
+        with self.lock:
+            scores, indices = self._index_search(query_vectors, self._search_k(k))
+            results = [self._collect_results(scores[i], indices[i], k, min_score=min_similarity)
+                       for i in range(len(queries))]
+            return self._with_passages(query_vectors, results, k, min_similarity)
+        
+    def _with_passages(self, query_vectors, results, k, min_similarity=None, allowed_ids=None):
+        """
+        Folds full-text passage matches into per-query results, so each paper
+        scores the better of its abstract and its best passage.
+        """
+        if not self.chunks.ntotal:
+            return results
+        merged = []
+        for rows, passages in zip(results, self.chunks.search(query_vectors, k, allowed_ids)):
+            best = dict(rows)
+            for doc_id, score in passages:
+                if min_similarity is not None and score < min_similarity:
+                    break
+                if doc_id in self.documents and score > best.get(doc_id, -1.0):
+                    best[doc_id] = score
+            merged.append(sorted(best.items(), key=lambda item: item[1], reverse=True)[:k])
+        return merged
+        
+    def search_vectors(self, vectors, k=5, min_similarity=None):
+        """Nearest documents to precomputed embeddings, one result list per row, from one FAISS call."""
+        vectors = normalize_rows(vectors)
+        with self.lock:
+            if len(vectors) == 0 or not self.documents:
+                return [[] for _ in range(len(vectors))]
+            scores, indices = self._index_search(vectors, self._search_k(k))
+            return [self._collect_results(scores[i], indices[i], k, min_score=min_similarity)
+                    for i in range(len(vectors))]
+        
+    def _filtered_search(self, query_vector, k, allowed_ids, min_similarity=None):
+        ids = np.array(sorted(doc_id for doc_id in allowed_ids if doc_id in self.documents), dtype='int64')
+        if len(ids) == 0:
+            return []
+        if len(ids) <= EXACT_FILTER_LIMIT:
+            # Small allow-list: exact similarities to just those vectors beat any ANN traversal
+            scores = self.index.reconstruct_batch(ids) @ query_vector[0]
+            order = np.argsort(-scores)[:k]
+            return [(int(ids[i]), float(scores[i])) for i in order
+                    if min_similarity is None or scores[i] >= min_similarity]
             
-            results = []
-            for i in range(len(indices[0])):
-                result_idx = indices[0][i]
-                if result_idx != -1 and result_idx < len(self.documents):
-                    result_doc_id = self.documents[result_idx]
-                    if result_doc_id != doc_id: # Exclude self
-                        results.append((result_doc_id, float(distances[0][i])))
-                        
-            return results[:k]
-        except Exception as e:
-            print(f"Error finding similar docs: {e}")
+        scores, indices = self._index_search(query_vector, min(k, len(ids)), allowed=ids)
+        return self._collect_results(scores[0], indices[0], k, min_score=min_similarity)
+
+    def cache_stats(self):
+        stats = self.query_cache.stats()
+        if self.encoder is not None:
+            stats["encoder"] = self.encoder.stats()
+        return stats
+        
+    def lexical_search(self, query, k=5, allowed_ids=None):
+        """BM25 matches over titles and abstracts as [(doc_id, score)], higher is better."""
+        if self.lexical is None:
             return []
+        return self.lexical.search(query, k, allowed_ids=allowed_ids)
+        
+    def hybrid_search(self, query, k=5, candidates=50, allowed_ids=None):
+        """
+        Fuses BM25 and vector rankings with reciprocal rank fusion, returning
+        [(doc_id, score)] best first. Keyword lookups (model or dataset names,
+        quoted phrases) that match lexically skip encoding and the vector search.
+        """
+        if self.lexical is None:
+            return self.search(query, k, allowed_ids)
+        if is_keyword_query(query):
+            matches = self.lexical.search(query.strip('"'), k, phrase=True, allowed_ids=allowed_ids)
+            if matches:
+                return matches
+                
+        lexical = self.lexical.search(query, candidates, allowed_ids=allowed_ids)
+        semantic = self.search(query, candidates, allowed_ids)
+        return reciprocal_rank_fusion([lexical, semantic], self.rrf_k)[:k]
+
+    def find_similar(self, doc_id, k=5):
+        """Find papers similar to the given doc_id."""
+        with self.lock:
+            if doc_id not in self.documents:
+                return []
+                
+            try:
+                # Vectors are keyed by Document.id, so the lookup is a hash probe
+                vector = self.index.reconstruct(doc_id)
+                vector = np.array([vector]).astype('float32')
+                
+                # Search k+1 because the doc itself will be the top result (similarity 1)
+                scores, indices = self._index_search(vector, self._search_k(k + 1))
+                return self._collect_results(scores[0], indices[0], k, exclude=doc_id)
+            except Exception as e:
+                print(f"Error finding similar docs: {e}")
+                return []
+
+    def find_similar_many(self, doc_ids, k=5):
+        """Batched find_similar(): {doc_id: [(related_id, similarity)]} from one FAISS search."""
+        with self.lock:
+            ids = np.array([doc_id for doc_id in doc_ids if doc_id in self.documents], dtype='int64')
+            if len(ids) == 0:
+                return {}
+            vectors = self.index.reconstruct_batch(ids)
+            scores, indices = self._index_search(vectors, self._search_k(k + 1))
+            return {int(doc_id): self._collect_results(scores[i], indices[i], k, exclude=int(doc_id))
+                    for i, doc_id in enumerate(ids)}
+
+    def cluster(self, k, niter=20, seed=1234, batch_size=10000):
+        """
+        Spherical k-means over every indexed vector. Returns (centroids,
+        doc_ids, assignments, similarities): unit-length centroids, and for
+        each doc the centroid row it belongs to and its cosine similarity.
+        """
+        with self.lock:
+            ids = np.array(sorted(self.documents), dtype='int64')
+            vectors = np.empty((len(ids), self.dimension), dtype='float32')
+            for start in range(0, len(ids), batch_size):
+                # PQ reconstructions are approximate, so re-normalise
+                vectors[start:start + batch_size] = normalize_rows(self.index.reconstruct_batch(ids[start:start + batch_size]))
+        # Training runs on the copy, so searches aren't held up
+        kmeans = faiss.Kmeans(self.dimension, k, niter=niter, spherical=True, seed=seed)
+        kmeans.train(vectors)
+        scores, labels = kmeans.index.search(vectors, 1)
+        return kmeans.centroids, ids, labels[:, 0], scores[:, 0]
+
+    def assign(self, doc_ids, centroids):
+        """Nearest centroid of each indexed doc: {doc_id: (centroid row, cosine similarity)}."""
+        with self.lock:
+            ids = np.array([doc_id for doc_id in doc_ids if doc_id in self.documents], dtype='int64')
+            if len(ids) == 0:
+                return {}
+            vectors = self.index.reconstruct_batch(ids)
+        similarities = normalize_rows(vectors) @ np.asarray(centroids, dtype='float32').T
+        best = similarities.argmax(axis=1)
+        return {int(doc_id): (int(row), float(similarities[i, row])) for i, (doc_id, row) in enumerate(zip(ids, best))}
 
     def rebuild_index(self, documents):
         """
@@ -84,25 +536,163 @@ class SearchEngine:
         Expected documents to have 'id', 'abstract', and optionally 'embedding'.
         """
         print(f"Rebuilding index for {len(documents)} documents...")
-        self.index = faiss.IndexFlatL2(self.dimension)
-        self.documents = []
-        
-        texts_to_encode = []
-        docs_to_update = []
+        doc_ids, vectors = self._collect_vectors(documents)
+        index = self._build_index(vectors)
+        with self.lock:
+            self.index = index
+            self.set_search_params()
+            self.documents = set()
+            self.positions = {}
+            self.tombstones = set()
+            self.add_documents(doc_ids, vectors)
+
+    def extend_index(self, documents):
+        """
+        Appends Document objects to the current index without resetting it.
+        Used to replay rows ingested after a snapshot was written.
+        """
+        doc_ids, vectors = self._collect_vectors(documents)
+        self.add_documents(doc_ids, vectors)
+
+    def _collect_vectors(self, documents):
+        """
+        Returns (doc_ids, float32 matrix) for the given documents, encoding any
+        that have no stored embedding yet. Stored embeddings are decoded
+        straight into a single preallocated matrix.
+        """
+        stored = [doc for doc in documents if doc.embedding]
+        docs_to_update = [doc for doc in documents if not doc.embedding]
         
-        for doc in documents:
-            if doc.embedding:
-                self.add_document(doc.id, doc.abstract, pickle.loads(doc.embedding))
-            else:
-                texts_to_encode.append(doc.abstract)
-                docs_to_update.append(doc)
+        matrix = np.empty((len(stored) + len(docs_to_update), self.dimension), dtype='float32')
+        for i, doc in enumerate(stored):
+            decode_into(doc.embedding, matrix[i])
                 
         # Bulk encode missing embeddings
-        if texts_to_encode:
-            print(f"Generating embeddings for {len(texts_to_encode)} new documents...")
-            embeddings = self.bulk_encode(texts_to_encode)
-            for i, doc in enumerate(docs_to_update):
+        if docs_to_update:
+            print(f"Generating embeddings for {len(docs_to_update)} new documents...")
+            embeddings = self.bulk_encode([doc.abstract for doc in docs_to_update])
+            matrix[len(stored):] = embeddings
+            for doc, embedding in zip(docs_to_update, embeddings):
                 # Save back to doc object (caller needs to commit to DB)
-                header_embedding = embeddings[i]
-                self.add_document(doc.id, doc.abstract, header_embedding)
-                doc.embedding = pickle.dumps(header_embedding)
+                doc.embedding = encode_embedding(embedding, self.embedding_dtype)
+                
+        doc_ids = [doc.id for doc in stored] + [doc.id for doc in docs_to_update]
+        # Quantizers are trained on this matrix, so rows stored before normalisation are fixed up here
+        return doc_ids, normalize_rows(matrix)
+
+    def save_snapshot(self, path, doc_count, max_doc_id, corpus_version=0, max_chunk_id=0):
+        """
+        Writes the FAISS index to `path` + '.faiss', the chunk index to
+        `path` + '.chunks.faiss' and the id maps plus corpus state to
+        `path` + '.json'. Every file is written to a temporary name and swapped
+        in atomically, metadata last, so concurrent workers never read a torn snapshot.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        index_tmp = f"{path}.faiss.{os.getpid()}.tmp"
+        chunks_tmp = f"{path}.chunks.faiss.{os.getpid()}.tmp"
+        meta_tmp = f"{path}.json.{os.getpid()}.tmp"
+        
+        with self.lock:
+            faiss.write_index(self.index, index_tmp)
+            faiss.write_index(self.chunks.index, chunks_tmp)
+            chunk_ids = sorted(self.chunks.doc_of)
+            built_type, nlist = describe_index(self.index)
+            meta = {
+                "model_name": self.model_name,
+                "dimension": self.dimension,
+                "index_type": self.index_type, # As configured
+                "built_index_type": built_type, # What was actually trained, e.g. a flat fallback
+                "nlist": nlist,
+                "metric": "inner_product",
+                "doc_count": doc_count,
+                "max_doc_id": max_doc_id,
+                "corpus_version": corpus_version,
+                "ntotal": int(self.index.ntotal),
+                "documents": sorted(self.documents),
+                "tombstone_positions": sorted(self.tombstones),
+                "max_chunk_id": max_chunk_id,
+                "chunk_ids": chunk_ids,
+                "chunk_docs": [self.chunks.doc_of[chunk_id] for chunk_id in chunk_ids]
+            }
+        with open(meta_tmp, 'w') as f:
+            json.dump(meta, f)
+            
+        os.replace(index_tmp, f"{path}.faiss")
+        os.replace(chunks_tmp, f"{path}.chunks.faiss")
+        os.replace(meta_tmp, f"{path}.json")
+        print(f"Saved search index snapshot ({len(self.documents)} vectors, {len(chunk_ids)} passages).")
+
+    def load_snapshot(self, path):
+        """
+        Loads a snapshot written by save_snapshot. The index file is memory-mapped
+        where FAISS supports it. Returns the snapshot metadata, or None if the
+        snapshot is missing, unreadable or was built for a different model.
+        """
+        index_path = f"{path}.faiss"
+        meta_path = f"{path}.json"
+        if not (os.path.exists(index_path) and os.path.exists(meta_path)):
+            return None
+            
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get("model_name") != self.model_name or meta.get("dimension") != self.dimension:
+                print("Search index snapshot was built for a different model, ignoring it.")
+                return None
+            if meta.get("metric") != "inner_product":
+                print("Search index snapshot uses L2 distances, ignoring it.")
+                return None
+            if meta.get("index_type", "flat") != self.index_type:
+                print("Search index snapshot uses a different index type, ignoring it.")
+                return None
+                
+            index = None
+            if meta.get("built_index_type", self.index_type) in ('flat', 'hnsw'):
+                # Memory-mapped IVF lists are read-only, so only map indexes that stay appendable
+                try:
+                    index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+                except RuntimeError:
+                    pass
+            if index is None:
+                index = faiss.read_index(index_path)
+                
+            if index.ntotal != meta.get("ntotal"):
+                print("Search index snapshot is inconsistent, ignoring it.")
+                return None
+            if meta.get("tombstones"):
+                print("Search index snapshot predates position tombstones, ignoring it.")
+                return None
+        except Exception as e:
+            print(f"Failed to load search index snapshot: {e}")
+            return None
+            
+        with self.lock:
+            self.index = index
+            self.documents = set(meta["documents"])
+            self.tombstones = set(meta.get("tombstone_positions", []))
+            self.positions = {}
+            if not supports_removal(index):
+                # Later positions win: a re-added doc's earlier vectors are all tombstoned
+                ids = faiss.rev_swig_ptr(index.id_map.data(), index.id_map.size())
+                self.positions = {int(doc_id): position for position, doc_id in enumerate(ids)
+                                  if position not in self.tombstones and doc_id in self.documents}
+            self.set_search_params()
+            self.chunks.clear()
+            if not self._load_chunk_snapshot(f"{path}.chunks.faiss", meta):
+                meta["max_chunk_id"] = 0 # Passages are reloaded from the table
+        print(f"Loaded search index snapshot ({len(self.documents)} vectors, {self.chunks.ntotal} passages).")
+        return meta
+
+    def _load_chunk_snapshot(self, path, meta):
+        if "max_chunk_id" not in meta or not os.path.exists(path):
+            return False
+        try:
+            index = faiss.read_index(path)
+        except RuntimeError as e:
+            print(f"Failed to load chunk index snapshot: {e}")
+            return False
+        if index.ntotal != len(meta["chunk_ids"]):
+            print("Chunk index snapshot is inconsistent, ignoring it.")
+            return False
+        self.chunks.restore(index, meta["chunk_ids"], meta["chunk_docs"])
+        return True
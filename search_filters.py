@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+from database import db
+from models import Document, DocumentConcept
+import graph_store
+
+SOURCES = ('arxiv', 'upload', 'manual')
+
+class SearchFilters:
+    """Dashboard filters: published date range, source and a mentioned entity."""
+    def __init__(self, published_from=None, published_to=None, source=None, entity=None):
+        self.published_from = published_from
+        self.published_to = published_to
+        self.source = source if source in SOURCES else None
+        self.entity = (entity or '').strip() or None
+
+    @classmethod
+    def from_args(cls, args):
+        """Parses request args (date_from, date_to as YYYY-MM-DD; source; entity), ignoring bad dates."""
+        return cls(published_from=parse_date(args.get('date_from')),
+                   published_to=parse_date(args.get('date_to')),
+                   source=args.get('source'),
+                   entity=args.get('entity'))
+
+    def key(self):
+        """Hashable form, for caching result lists per filter combination."""
+        return (self.published_from, self.published_to, self.source, self.entity and graph_store.normalize_concept(self.entity))
+
+    def __bool__(self):
+        return any((self.published_from, self.published_to, self.source, self.entity))
+
+    def apply(self, query):
+        """Restricts a Document query to the matching rows."""
+        if self.published_from:
+            query = query.filter(Document.published_date >= self.published_from)
+        if self.published_to:
+            # Inclusive of the whole end day
+            query = query.filter(Document.published_date < self.published_to + timedelta(days=1))
+        if self.source:
+            query = query.filter(Document.source_filter(self.source))
+        if self.entity:
+            graph_store.ensure_graph()
+            concept_ids = [concept.id for concept in graph_store.find_concept(self.entity)]
+            query = query.filter(Document.id.in_(
+                db.session.query(DocumentConcept.doc_id).filter(DocumentConcept.concept_id.in_(concept_ids))))
+        return query
+
+    def doc_ids(self):
+        """Set of matching document ids, handed to the vector and lexical searches as an allow-list."""
+        return {doc_id for (doc_id,) in self.apply(db.session.query(Document.id))}
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
@@ -0,0 +1,287 @@
+"""
+Standalone search service. One process owns the SentenceTransformer model
+and the FAISS and BM25 indexes; gunicorn workers talk to it through
+SearchClient instead of each loading their own copy, so memory no longer
+grows with the worker count and every worker sees the same index.
+
+Usage:
+    python search_service.py --socket instance/search.sock
+    SEARCH_SERVICE_URL=unix://instance/search.sock gunicorn app:app
+
+or over localhost HTTP:
+    python search_service.py --port 8765
+    SEARCH_SERVICE_URL=http://127.0.0.1:8765 gunicorn app:app
+"""
+import argparse
+import base64
+import http.client
+import json
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import urlparse
+import numpy as np
+
+def pack_vectors(vectors):
+    """float32 matrix -> JSON-safe dict; base64 is ~4x smaller than a list of floats."""
+    vectors = np.ascontiguousarray(vectors, dtype='<f4')
+    return {"shape": list(vectors.shape), "data": base64.b64encode(vectors.tobytes()).decode('ascii')}
+
+def unpack_vectors(packed):
+    return np.frombuffer(base64.b64decode(packed['data']), dtype='<f4').reshape(packed['shape'])
+
+def _allowed(body):
+    ids = body.get('allowed_ids')
+    return None if ids is None else set(ids)
+
+class SearchServiceError(Exception):
+    pass
+
+class SearchService:
+    """
+    Dispatches JSON requests to a single SearchEngine. The engine's own lock
+    keeps index updates from racing searches across the handler threads.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+
+    def handle(self, method, body):
+        engine = self.engine
+        if method == 'encode':
+            return {"embeddings": pack_vectors(engine.bulk_encode(body['texts']))}
+        if method == 'search':
+            queries = body['queries']
+            k, min_similarity, allowed_ids = body.get('k', 5), body.get('min_similarity'), _allowed(body)
+            if allowed_ids is None:
+                results = engine.search_many(queries, k, min_similarity)
+            else:
+                results = [engine.search(query, k, allowed_ids, min_similarity) for query in queries]
+            return {"results": results}
+        if method == 'search_vectors':
+            return {"results": engine.search_vectors(unpack_vectors(body['embeddings']), body.get('k', 5),
+                                                     body.get('min_similarity'))}
+        if method == 'lexical_search':
+            return {"results": engine.lexical_search(body['query'], body.get('k', 5), _allowed(body))}
+        if method == 'hybrid_search':
+            return {"results": engine.hybrid_search(body['query'], body.get('k', 5), body.get('candidates', 50),
+                                                    _allowed(body))}
+        if method == 'find_similar':
+            return {"results": engine.find_similar(body['doc_id'], body.get('k', 5))}
+        if method == 'find_similar_many':
+            return {"results": engine.find_similar_many(body['doc_ids'], body.get('k', 5))}
+        if method == 'add_documents':
+            embeddings = body.get('embeddings')
+            if embeddings is None:
+                embeddings = engine.bulk_encode([abstract for _, abstract in body['texts']])
+            else:
+                embeddings = unpack_vectors(embeddings)
+            engine.add_documents(body['doc_ids'], embeddings, texts=body.get('texts'))
+            return {"embeddings": pack_vectors(embeddings)}
+        if method == 'add_chunks':
+            engine.add_chunks(body['doc_id'], body['chunk_ids'], unpack_vectors(body['embeddings']))
+            return {}
+        if method == 'cluster':
+            centroids, doc_ids, assignments, scores = engine.cluster(body['k'], body.get('niter', 20))
+            return {"centroids": pack_vectors(centroids), "doc_ids": doc_ids.tolist(),
+                    "assignments": assignments.tolist(), "scores": scores.tolist()}
+        if method == 'assign':
+            assigned = engine.assign(body['doc_ids'], unpack_vectors(body['centroids']))
+            return {"assignments": assigned}
+        if method == 'remove_document':
+            return {"removed": engine.remove_document(body['doc_id'])}
+        if method == 'doc_ids':
+            return {"doc_ids": engine.doc_ids()}
+        if method == 'stats':
+            return {"documents": len(engine.documents), "chunks": engine.chunks.ntotal,
+                    "query_cache": engine.cache_stats()}
+        raise LookupError(method)
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, so each worker thread reuses one connection
+    service = None
+
+    def do_POST(self):
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            self._reply(200, self.service.handle(self.path.strip('/'), body))
+        except LookupError:
+            self._reply(404, {"error": f"Unknown method {self.path}"})
+        except Exception as e:
+            print(f"Search service error on {self.path}: {e}")
+            self._reply(500, {"error": str(e)})
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass # A line per search would drown the app log
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class SearchClient:
+    """
+    Stand-in for SearchEngine in the web workers: same methods and return
+    values, but every call is forwarded to the search service.
+    """
+    def __init__(self, url, timeout=30):
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        if self.url.startswith('unix://'):
+            return _UnixHTTPConnection(self.url[len('unix://'):], self.timeout)
+        parsed = urlparse(self.url)
+        return http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=self.timeout)
+
+    def _call(self, method, payload):
+        data = json.dumps(payload).encode('utf-8')
+        for attempt in range(2):
+            conn = getattr(self._local, 'conn', None) or self._connect()
+            self._local.conn = conn
+            try:
+                conn.request('POST', f'/{method}', data, {'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                body = json.loads(response.read())
+                break
+            except (OSError, http.client.HTTPException) as e:
+                # The service may have restarted and dropped the kept-alive connection; retry once
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise SearchServiceError(f"Search service unreachable at {self.url}: {e}")
+        if response.status != 200:
+            raise SearchServiceError(body.get('error', f"HTTP {response.status}"))
+        return body
+
+    @staticmethod
+    def _results(rows):
+        return [(doc_id, score) for doc_id, score in rows]
+
+    def encode(self, text):
+        return self.bulk_encode([text])[0]
+
+    def bulk_encode(self, texts):
+        return unpack_vectors(self._call('encode', {"texts": list(texts)})['embeddings'])
+
+    encode_query = encode
+
+    def search(self, query, k=5, allowed_ids=None, min_similarity=None):
+        return self.search_many([query], k, min_similarity, allowed_ids)[0]
+
+    def search_many(self, queries, k=5, min_similarity=None, allowed_ids=None):
+        payload = {"queries": list(queries), "k": k, "min_similarity": min_similarity}
+        if allowed_ids is not None:
+            payload["allowed_ids"] = sorted(allowed_ids)
+        return [self._results(rows) for rows in self._call('search', payload)['results']]
+
+    def search_vectors(self, vectors, k=5, min_similarity=None):
+        payload = {"embeddings": pack_vectors(vectors), "k": k, "min_similarity": min_similarity}
+        return [self._results(rows) for rows in self._call('search_vectors', payload)['results']]
+
+    def lexical_search(self, query, k=5, allowed_ids=None):
+        payload = {"query": query, "k": k, "allowed_ids": sorted(allowed_ids) if allowed_ids is not None else None}
+        return self._results(self._call('lexical_search', payload)['results'])
+
+    def hybrid_search(self, query, k=5, candidates=50, allowed_ids=None):
+        payload = {"query": query, "k": k, "candidates": candidates,
+                   "allowed_ids": sorted(allowed_ids) if allowed_ids is not None else None}
+        return self._results(self._call('hybrid_search', payload)['results'])
+
+    def find_similar(self, doc_id, k=5):
+        return self._results(self._call('find_similar', {"doc_id": doc_id, "k": k})['results'])
+
+    def find_similar_many(self, doc_ids, k=5):
+        results = self._call('find_similar_many', {"doc_ids": [int(doc_id) for doc_id in doc_ids], "k": k})['results']
+        return {int(doc_id): self._results(rows) for doc_id, rows in results.items()} # JSON keys are strings
+
+    def add_documents(self, doc_ids, embeddings, texts=None):
+        if len(doc_ids) == 0:
+            return
+        payload = {"doc_ids": [int(doc_id) for doc_id in doc_ids], "embeddings": pack_vectors(embeddings),
+                   "texts": [list(text) for text in texts] if texts is not None else None}
+        self._call('add_documents', payload)
+
+    def add_document(self, doc_id, text, embedding=None, title=None):
+        """Encodes on the service when no embedding is given. Returns the embedding."""
+        payload = {"doc_ids": [doc_id], "texts": [[title, text]],
+                   "embeddings": pack_vectors([embedding]) if embedding is not None else None}
+        return unpack_vectors(self._call('add_documents', payload)['embeddings'])[0]
+
+    def update_document(self, doc_id, text, embedding=None, title=None):
+        return self.add_document(doc_id, text, embedding, title)
+
+    def add_chunks(self, doc_id, chunk_ids, embeddings):
+        if len(chunk_ids) == 0:
+            return
+        self._call('add_chunks', {"doc_id": int(doc_id), "chunk_ids": [int(chunk_id) for chunk_id in chunk_ids],
+                                  "embeddings": pack_vectors(embeddings)})
+
+    def cluster(self, k, niter=20):
+        result = self._call('cluster', {"k": k, "niter": niter})
+        return (unpack_vectors(result['centroids']), np.array(result['doc_ids'], dtype='int64'),
+                np.array(result['assignments'], dtype='int64'), np.array(result['scores'], dtype='float32'))
+
+    def assign(self, doc_ids, centroids):
+        result = self._call('assign', {"doc_ids": [int(doc_id) for doc_id in doc_ids], "centroids": pack_vectors(centroids)})
+        return {int(doc_id): tuple(match) for doc_id, match in result['assignments'].items()}
+
+    def remove_document(self, doc_id):
+        return self._call('remove_document', {"doc_id": doc_id})['removed']
+
+    def doc_ids(self):
+        return self._call('doc_ids', {})['doc_ids']
+
+    def cache_stats(self):
+        return self._call('stats', {})['query_cache']
+
+def serve(socket_path=None, host='127.0.0.1', port=8765):
+    from app import app, get_search_engine
+    app.config['SEARCH_SERVICE_URL'] = None # This process is the one that loads the engine
+    engine = get_search_engine()
+    if engine is None:
+        raise SystemExit("Search engine failed to initialise.")
+    RequestHandler.service = SearchService(engine)
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path) # Left behind by a previous run
+        server = ThreadingUnixHTTPServer(socket_path, RequestHandler)
+        print(f"Search service listening on unix://{socket_path}")
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+        print(f"Search service listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--socket', help="Unix socket path (preferred when the workers share a host)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    serve(socket_path=args.socket, host=args.host, port=args.port)
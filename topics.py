@@ -0,0 +1,148 @@
+import math
+from collections import Counter
+from datetime import datetime
+import numpy as np
+from sqlalchemy import delete, insert, update
+from database import db
+from models import Document, Concept, DocumentConcept, Topic, DocumentTopic, TopicState
+from embedding_codec import encode_embedding, decode_embedding
+import nlp_engine
+
+TOPIC_COUNT = 20
+MIN_TOPIC_SIZE = 39 # FAISS wants ~39 training points per centroid; smaller corpora get fewer topics
+RECLUSTER_FRACTION = 0.25 # Re-cluster once this share of the corpus was assigned incrementally
+LABEL_CONCEPTS = 3
+
+def topic_state():
+    return db.session.get(TopicState, 1)
+
+def topic_version():
+    state = topic_state()
+    return state.version if state else None
+
+def _bump_version(**values):
+    db.session.execute(update(TopicState.__table__).where(TopicState.id == 1)
+                       .values(version=TopicState.version + 1, **values))
+
+def cluster(engine, k=TOPIC_COUNT, niter=20, batch_size=5000):
+    """
+    Recomputes every topic: spherical k-means over all indexed embeddings
+    (run next to the index by the engine), then labels from each cluster's
+    concepts and title terms. Old topics are replaced in one transaction.
+    Returns the number of topics.
+    """
+    n = Document.query.count()
+    k = min(k, n // MIN_TOPIC_SIZE)
+    if k < 1:
+        print(f"Only {n} documents, too few to cluster.")
+        return 0
+    print(f"Clustering {n} documents into {k} topics...")
+    centroids, doc_ids, assignments, scores = engine.cluster(k, niter)
+
+    db.session.execute(delete(DocumentTopic.__table__))
+    db.session.execute(delete(Topic.__table__))
+    sizes = np.bincount(assignments, minlength=k)
+    topics = [Topic(label='', size=int(sizes[row]), centroid=encode_embedding(centroids[row]),
+                    top_concepts=[], top_terms=[]) for row in range(k)]
+    db.session.add_all(topics)
+    db.session.flush()
+    topic_ids = [topic.id for topic in topics]
+    rows = [{"doc_id": int(doc_id), "topic_id": topic_ids[row], "score": float(score)}
+            for doc_id, row, score in zip(doc_ids, assignments, scores)]
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(insert(DocumentTopic.__table__), rows[start:start + batch_size])
+    label_topics(topics)
+
+    if topic_state() is None:
+        db.session.add(TopicState(id=1, version=0))
+        db.session.flush()
+    _bump_version(clustered_docs=len(doc_ids), assigned_since=0, clustered_at=datetime.utcnow())
+    db.session.commit()
+    print(f"Stored {k} topics.")
+    return k
+
+def label_topics(topics, title_sample=200):
+    """
+    Labels topics with their most distinctive concepts: frequency in the
+    topic weighted by inverse document frequency in the corpus, so concepts
+    common to every topic don't win. Title terms fill in when a topic has
+    few concepts.
+    """
+    total = max(Document.query.count(), 1)
+    by_topic = {topic.id: [] for topic in topics}
+    counts = db.session.query(DocumentTopic.topic_id, Concept.text, Concept.doc_count, db.func.count()) \
+        .join(DocumentConcept, DocumentConcept.doc_id == DocumentTopic.doc_id) \
+        .join(Concept, Concept.id == DocumentConcept.concept_id) \
+        .filter(Concept.doc_count > 1) \
+        .group_by(DocumentTopic.topic_id, Concept.id)
+    for topic_id, text, doc_count, count in counts:
+        if topic_id in by_topic:
+            by_topic[topic_id].append((count * math.log(total / doc_count), text))
+
+    for topic in topics:
+        topic.top_concepts = [text for _, text in sorted(by_topic[topic.id], reverse=True)[:10]]
+        # Titles of the papers closest to the centroid are the most typical
+        titles = [title for (title,) in db.session.query(Document.title)
+                  .join(DocumentTopic, DocumentTopic.doc_id == Document.id)
+                  .filter(DocumentTopic.topic_id == topic.id)
+                  .order_by(DocumentTopic.score.desc()).limit(title_sample)]
+        topic.top_terms = nlp_engine.top_terms(" ".join(titles), 10)
+        words = topic.top_concepts[:LABEL_CONCEPTS]
+        words += [term for term, _ in topic.top_terms if term not in {w.casefold() for w in words}][:LABEL_CONCEPTS - len(words)]
+        topic.label = (" · ".join(words) or f"Topic {topic.id}")[:300]
+
+def assign_documents(engine, doc_ids):
+    """
+    Adds newly indexed papers to the topic with the nearest centroid and
+    counts them towards the next re-cluster. Labels are left as they are.
+    Runs in the caller's transaction.
+    """
+    if not doc_ids or topic_version() is None:
+        return
+    topics = Topic.query.order_by(Topic.id).all()
+    if not topics:
+        return
+    centroids = np.vstack([decode_embedding(topic.centroid) for topic in topics])
+    assigned = engine.assign(doc_ids, centroids)
+    if not assigned:
+        return
+    table = DocumentTopic.__table__
+    db.session.execute(delete(table).where(table.c.doc_id.in_(list(assigned))))
+    db.session.execute(insert(table), [{"doc_id": doc_id, "topic_id": topics[row].id, "score": score}
+                                       for doc_id, (row, score) in assigned.items()])
+    for row, count in Counter(row for row, _ in assigned.values()).items():
+        topics[row].size += count
+    _bump_version(assigned_since=TopicState.assigned_since + len(assigned))
+
+def remove_document(doc_id):
+    """Drops a paper's assignment before the paper itself is deleted."""
+    assignment = db.session.get(DocumentTopic, doc_id)
+    if assignment is None:
+        return
+    Topic.query.filter_by(id=assignment.topic_id).update({Topic.size: Topic.size - 1}, synchronize_session=False)
+    db.session.delete(assignment)
+    _bump_version()
+
+def needs_recluster(fraction=RECLUSTER_FRACTION):
+    """True once topics exist and the papers assigned since the last run exceed `fraction` of it."""
+    state = topic_state()
+    return state is not None and state.assigned_since > fraction * max(state.clustered_docs, 1)
+
+def topic_overview():
+    """Every topic, largest first, as JSON-ready dicts."""
+    return [{"id": topic.id, "label": topic.label, "size": topic.size,
+             "concepts": topic.top_concepts, "terms": [term for term, _ in topic.top_terms]}
+            for topic in Topic.query.options(db.defer(Topic.centroid)).order_by(Topic.size.desc(), Topic.id)]
+
+def topic_papers(topic_id, limit=20, offset=0):
+    """Papers of a topic, most typical (closest to the centroid) first."""
+    return Document.query.options(db.defer(Document.embedding)) \
+        .join(DocumentTopic, DocumentTopic.doc_id == Document.id) \
+        .filter(DocumentTopic.topic_id == topic_id) \
+        .order_by(DocumentTopic.score.desc()).offset(offset).limit(limit).all()
+
+if __name__ == '__main__':
+    from app import app, get_search_engine
+    with app.app_context():
+        db.create_all()
+        cluster(get_search_engine(), k=app.config['TOPIC_COUNT'])